@@ -38,6 +38,13 @@ default_keys = (
     ('contact_email_on_error', unicode, []),
     ('dallinger_email_address', unicode, []),
     ('dallinger_email_password', unicode, [], True),
+    ('database_concurrency', unicode, []),
+    ('database_pool', unicode, []),
+    ('database_pool_overflow', int, []),
+    ('database_pool_pre_ping', bool, []),
+    ('database_pool_recycle', int, []),
+    ('database_pool_size', int, []),
+    ('database_pool_timeout', int, []),
     ('database_size', unicode, []),
     ('database_url', unicode, []),
     ('description', unicode, []),
@@ -58,6 +65,7 @@ default_keys = (
     ('num_dynos_worker', int, []),
     ('organization_name', unicode, []),
     ('port', int, ['PORT']),
+    ('publish_in_background', bool, []),
     ('qualification_blacklist', unicode, []),
     ('recruiter', unicode, []),
     ('threads', unicode, []),
@@ -67,6 +75,9 @@ default_keys = (
     ('webdriver_url', unicode, []),
     ('whimsical', bool, []),
     ('sentry', bool, []),
+    ('serialized_backoff', float, []),
+    ('serialized_max_attempts', int, []),
+    ('serialized_max_backoff', float, []),
 )
 
 
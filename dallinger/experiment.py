@@ -1,6 +1,5 @@
 """The base experiment class."""
 
-from collections import Counter
 from functools import wraps
 import imp
 import inspect
@@ -14,6 +13,9 @@ import time
 import uuid
 
 from sqlalchemy import and_
+from sqlalchemy import exists
+from sqlalchemy import false
+from sqlalchemy import func
 
 from dallinger.config import get_config, LOCAL_CONFIG
 from dallinger.data import Data
@@ -173,7 +175,7 @@ class Experiment(object):
 
     def setup(self):
         """Create the networks if they don't already exist."""
-        if not self.networks():
+        if not self.count_networks():
             for _ in range(self.practice_repeats):
                 network = self.create_network()
                 network.role = "practice"
@@ -190,27 +192,56 @@ class Experiment(object):
 
     def networks(self, role="all", full="all"):
         """All the networks in the experiment."""
+        return self._network_query(role, full).all()
+
+    def network_ids(self, role="all", full="all"):
+        """The ids of the networks in the experiment, in order.
+
+        Like :meth:`count_networks`, the result is remembered until the
+        networks change or the transaction ends.
+
+        """
+        return self._network_state("ids", role, full)
+
+    def count_networks(self, role="all", full="all"):
+        """The number of networks in the experiment.
+
+        Use this rather than ``len(self.networks())`` when only the number
+        matters, such as in :meth:`recruit`. The result is remembered until
+        the networks change or the transaction ends.
+
+        """
+        return self._network_state("count", role, full)
+
+    def _network_query(self, role, full):
         if full not in ["all", True, False]:
             raise ValueError("full must be boolean or all, it cannot be {}"
                              .format(full))
 
-        if full == "all":
-            if role == "all":
-                return Network.query.all()
-            else:
-                return Network\
-                    .query\
-                    .filter_by(role=role)\
-                    .all()
-        else:
-            if role == "all":
-                return Network.query.filter_by(full=full)\
-                    .all()
+        query = Network.query
+        if role != "all":
+            query = query.filter(Network.role == role)
+        if full != "all":
+            query = query.filter(Network.full == full)
+        return query
+
+    def _network_state(self, kind, role, full):
+        session = Network.query.session
+        # Write pending changes first, flushing networks clears the memo
+        session.flush()
+        key = (kind, role, full)
+        memo = session.info.get("networks", {})
+        if key not in memo:
+            query = self._network_query(role, full)
+            if kind == "count":
+                value = query.count()
             else:
-                return Network\
-                    .query\
-                    .filter(and_(Network.role == role, Network.full == full))\
-                    .all()
+                value = [id for id, in query.with_entities(Network.id)
+                         .order_by(Network.id)]
+            # The query may have started a transaction, which resets the memo
+            session.info.setdefault("networks", {})[key] = value
+            return value
+        return memo[key]
 
     def get_network_for_participant(self, participant):
         """Find a network for a participant.
@@ -220,47 +251,86 @@ class Experiment(object):
         first complete networks with `role="practice"` before doing all other
         networks in a random order.
 
+        The chosen network is locked until the end of the transaction, so
+        concurrent requests can't fill it before the participant is added.
+
         """
         key = participant.id
-        networks_with_space = Network.query.filter_by(
-            full=False).order_by(Network.id).all()
-        networks_participated_in = [
-            node.network_id for node in
-            Node.query.with_entities(Node.network_id)
-                .filter_by(participant_id=participant.id).all()
-        ]
-
-        legal_networks = [
-            net for net in networks_with_space
-            if net.id not in networks_participated_in
-        ]
-
-        if not legal_networks:
-            self.log("No networks available, returning None", key)
-            return None
-
+        legal_networks = self.available_networks(participant)
         self.log("{} networks out of {} available"
                  .format(len(legal_networks),
                          (self.practice_repeats + self.experiment_repeats)),
                  key)
 
-        legal_practice_networks = [net for net in legal_networks
-                                   if net.role == "practice"]
-        if legal_practice_networks:
-            chosen_network = legal_practice_networks[0]
-            self.log("Practice networks available."
-                     "Assigning participant to practice network {}."
-                     .format(chosen_network.id), key)
-        else:
-            chosen_network = self.choose_network(legal_networks, participant)
-            self.log("No practice networks available."
-                     "Assigning participant to experiment network {}"
-                     .format(chosen_network.id), key)
-        return chosen_network
+        while legal_networks:
+            legal_practice_networks = [net for net in legal_networks
+                                       if net.role == "practice"]
+            if legal_practice_networks:
+                chosen_id = legal_practice_networks[0].id
+                self.log("Practice networks available."
+                         "Assigning participant to practice network {}."
+                         .format(chosen_id), key)
+            else:
+                chosen_id = self._choose_network_id(legal_networks,
+                                                    participant)
+                self.log("No practice networks available."
+                         "Assigning participant to experiment network {}"
+                         .format(chosen_id), key)
+
+            # Another participant may have filled the network meanwhile
+            network = Network.query.get(chosen_id)
+            network.lock()
+            if not network.full:
+                return network
+            legal_networks = [net for net in legal_networks
+                              if net.id != chosen_id]
+
+        self.log("No networks available, returning None", key)
+        return None
+
+    def available_networks(self, participant):
+        """The networks a participant can join, ordered by id.
+
+        These are the networks that aren't full and that the participant
+        doesn't have a node in yet. Each is an ``(id, role)`` row rather than
+        a :class:`~dallinger.models.Network`, so this stays cheap with many
+        networks.
+
+        """
+        participated = exists().where(and_(
+            Node.network_id == Network.id,
+            Node.participant_id == participant.id))
+        return Network.query.with_entities(Network.id, Network.role)\
+            .filter(Network.full == false())\
+            .filter(~participated)\
+            .order_by(Network.id)\
+            .all()
 
     def choose_network(self, networks, participant):
+        """Choose the network to assign a participant to.
+
+        networks are the networks the participant can join, ordered by id, see
+        :meth:`available_networks`. Returns one of them.
+
+        """
         return random.choice(networks)
 
+    def _choose_network_id(self, rows, participant):
+        """The id of the network :meth:`choose_network` picks among rows.
+
+        The default choice is random, which only needs the ids, so the
+        networks are only loaded when an experiment overrides choose_network.
+        """
+        choose_network = getattr(self.choose_network, '__func__', None)
+        if choose_network is Experiment.__dict__['choose_network']:
+            return random.choice(rows).id
+
+        networks = Network.query\
+            .filter(Network.id.in_([row.id for row in rows]))\
+            .order_by(Network.id)\
+            .all()
+        return self.choose_network(networks, participant).id
+
     def create_node(self, participant, network):
         """Create a node for a participant."""
         return Node(network=network, participant=participant)
@@ -329,7 +399,7 @@ class Experiment(object):
         until all networks are full.
 
         """
-        if not self.networks(full=False):
+        if not self.count_networks(full=False):
             self.log("All networks full: closing recruitment", "-----")
             self.recruiter().close_recruitment()
 
@@ -341,10 +411,12 @@ class Experiment(object):
 
     def log_summary(self):
         """Log a summary of all the participants' status codes."""
-        participants = Participant.query\
-            .with_entities(Participant.status).all()
-        counts = Counter([p.status for p in participants])
-        sorted_counts = sorted(counts.items(), key=itemgetter(0))
+        counts = Participant.query\
+            .with_entities(Participant.status, func.count(Participant.id))\
+            .group_by(Participant.status)\
+            .all()
+        sorted_counts = sorted([(status, count) for status, count in counts],
+                               key=itemgetter(0))
         self.log("Status summary: {}".format(str(sorted_counts)))
         return sorted_counts
 
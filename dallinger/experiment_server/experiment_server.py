@@ -1,12 +1,14 @@
 """ This module provides the backend Flask server that serves an experiment. """
 
 from datetime import datetime
+from functools import wraps
 import gevent
 from json import dumps
 from operator import attrgetter
 import os
 import re
 import sys
+import time
 import user_agents
 
 from flask import (
@@ -41,6 +43,8 @@ from .utils import nocache
 config = get_config()
 if not config.ready:
     config.load()
+    # The database engine was created before the configuration was loaded
+    db.configure_engine()
 
 # Initialize the Dallinger database.
 session = db.session
@@ -53,6 +57,22 @@ app = Flask('Experiment_Server')
 
 Experiment = experiment.load()
 
+# The experiment of this process, see get_experiment().
+_experiment = None
+
+
+def get_experiment():
+    """Get the experiment instance of this worker process.
+
+    The experiment is created the first time it is needed and reused by
+    every request the process handles after that. It is bound to the scoped
+    session, which always refers to the session of the current request.
+    """
+    global _experiment
+    if _experiment is None:
+        _experiment = Experiment(session)
+    return _experiment
+
 
 """Load the experiment's extra routes, if any."""
 
@@ -214,7 +234,7 @@ def shutdown_session(_=None):
 @app.context_processor
 def inject_experiment():
     """Inject experiment and enviroment variables into the template context."""
-    exp = Experiment(session)
+    exp = get_experiment()
     return dict(
         experiment=exp,
         env=os.environ,
@@ -227,7 +247,11 @@ def inject_experiment():
 @app.route('/launch', methods=['POST'])
 def launch():
     """Launch the experiment."""
-    exp = Experiment(db.init_db(drop_all=False))
+    db.init_db(drop_all=False)
+    models.update_node_counts()
+    models.update_receive_order()
+    session.commit()
+    exp = Experiment(session)
     try:
         exp.log("Launching experiment...", "-----")
     except IOError as ex:
@@ -380,49 +404,62 @@ def advertisement():
         raise ExperimentError('status_incorrectly_set')
 
 
+# How long a summary is reused before it is computed again, in seconds
+SUMMARY_CACHE_SECONDS = 2
+
+# The latest summary of this process and when it was computed
+_summary = None
+
+
 @app.route('/summary', methods=['GET'])
 def summary():
-    """Summarize the participants' status codes."""
-    state = {
-        "status": "success",
-        "summary": Experiment(session).log_summary(),
-        "completed": False,
-    }
-    unfilled_nets = models.Network.query.filter(
-        models.Network.full != true()
-    ).with_entities(models.Network.id, models.Network.max_size).all()
-    working = models.Participant.query.filter_by(
-        status='working'
-    ).with_entities(func.count(models.Participant.id)).scalar()
-    state['unfilled_networks'] = len(unfilled_nets)
-    nodes_remaining = 0
-    required_nodes = 0
-    if state['unfilled_networks'] == 0:
-        if working == 0:
-            state['completed'] = True
-    else:
-        for net in unfilled_nets:
-            node_count = models.Node.query.filter_by(
-                network_id=net.id, failed=False,
-            ).with_entities(func.count(models.Node.id)).scalar()
-            net_size = net.max_size
-            required_nodes += net_size
-            nodes_remaining += net_size - node_count
-    state['nodes_remaining'] = nodes_remaining
-    state['required_nodes'] = required_nodes
+    """Summarize the participants' status codes.
+
+    The summary is polled while the experiment runs, so each process reuses
+    it for SUMMARY_CACHE_SECONDS.
+    """
+    global _summary
+    now = time.time()
+    if _summary is None or now - _summary[0] > SUMMARY_CACHE_SECONDS:
+        _summary = (now, summarize())
 
     return Response(
-        dumps(state),
+        dumps(_summary[1]),
         status=200,
         mimetype='application/json'
     )
 
 
+def summarize():
+    """Compute the /summary state, with a constant number of queries."""
+    status_counts = get_experiment().log_summary()
+    state = {
+        "status": "success",
+        "summary": status_counts,
+        "completed": False,
+    }
+    # node_count is kept up to date with the number of not-failed nodes
+    unfilled_networks, required_nodes, nodes = models.Network.query.filter(
+        models.Network.full != true()
+    ).with_entities(
+        func.count(models.Network.id),
+        func.coalesce(func.sum(models.Network.max_size), 0),
+        func.coalesce(func.sum(models.Network.node_count), 0),
+    ).one()
+    working = dict(status_counts).get('working', 0)
+    state['unfilled_networks'] = unfilled_networks
+    if unfilled_networks == 0 and working == 0:
+        state['completed'] = True
+    state['nodes_remaining'] = int(required_nodes - nodes)
+    state['required_nodes'] = int(required_nodes)
+    return state
+
+
 @app.route('/experiment_property/<prop>', methods=['GET'])
 @app.route('/experiment/<prop>', methods=['GET'])
 def experiment_property(prop):
     """Get a property of the experiment by name."""
-    exp = Experiment(session)
+    exp = get_experiment()
     try:
         value = exp.public_properties[prop]
     except KeyError:
@@ -460,6 +497,132 @@ def consent():
 """Routes for reading and writing to the database."""
 
 
+def _parse_known_class(value):
+    """Look up a class name in the experiment's known_classes."""
+    return get_experiment().known_classes[value]
+
+
+def _parse_bool(value):
+    """Convert "True" or "False" to a boolean."""
+    if isinstance(value, bool):
+        return value
+    if value not in ["True", "False"]:
+        raise ValueError(value)
+    return value == "True"
+
+
+def _parse_count(value):
+    """Convert a string to a non-negative integer."""
+    count = int(value)
+    if count < 0:
+        raise ValueError(value)
+    return count
+
+
+def _parse_since(value):
+    """Convert a watermark to an id or a creation time."""
+    if value.isdigit():
+        return int(value)
+    for time_format in ["%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"]:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    raise ValueError(value)
+
+
+# For each parameter type, the function that parses a value and the error
+# to report if it raises a KeyError or a ValueError.
+PARAMETER_TYPES = {
+    None: (lambda value: value, None),
+    "int": (int, "non-numeric {parameter}: {value}"),
+    "count": (_parse_count,
+              "{parameter} is not a non-negative integer: {value}"),
+    "known_class": (_parse_known_class,
+                    "unknown_class: {value} for parameter {parameter}"),
+    "bool": (_parse_bool, "non-boolean {parameter}: {value}"),
+    "since": (_parse_since,
+              "{parameter} is neither an id nor a time: {value}"),
+}
+
+
+class Parameter(object):
+    """A request parameter of a route, see :func:`parameters`.
+
+    parameter_type is the type the parameter should have
+    default is the value the parameter takes if it has not been passed
+    optional means the parameter is None if it has not been passed
+    """
+
+    def __init__(self, parameter_type=None, default=None, optional=False):
+        if parameter_type not in PARAMETER_TYPES:
+            raise ValueError("unknown parameter type: {}"
+                             .format(parameter_type))
+        self.parse, self.error = PARAMETER_TYPES[parameter_type]
+        self.default = default
+        self.optional = optional
+
+    def get(self, name, values=None):
+        """Get the parameter called name from the current request.
+
+        values can be given to read the parameter from another mapping than
+        the request's values. Raise a ValueError describing the problem if
+        it is missing or invalid.
+        """
+        if values is None:
+            values = request.values
+
+        try:
+            value = values[name]
+        except KeyError:
+            if self.default is not None:
+                return self.default
+            elif self.optional:
+                return None
+            raise ValueError("{} not specified".format(name))
+
+        try:
+            return self.parse(value)
+        except (KeyError, ValueError):
+            raise ValueError(self.error.format(parameter=name, value=value))
+
+
+def parameter_error(error):
+    """Return the error response for an invalid request parameter."""
+    msg = "{} {} request, {}".format(request.url, request.method, error)
+    return error_response(error_type=msg)
+
+
+def parse_parameters(schema, values=None):
+    """Parse all the parameters of a schema, see :func:`parameters`.
+
+    Return a dictionary of the parsed values, or raise a ValueError if any
+    of them is missing or invalid.
+    """
+    return dict((name, parameter.get(name, values))
+                for name, parameter in schema.items())
+
+
+def parameters(**schema):
+    """Declare the request parameters of a route.
+
+    Each keyword argument maps the name of a parameter to a
+    :class:`Parameter`. All the parameters are parsed in one pass before the
+    route runs and passed to it as keyword arguments. If any of them is
+    missing or invalid an error Response is returned instead.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kw):
+            try:
+                kw.update(parse_parameters(schema))
+            except ValueError as e:
+                return parameter_error(e)
+            return func(*args, **kw)
+        return wrapper
+    return decorator
+
+
 def request_parameter(parameter, parameter_type=None, default=None,
                       optional=False):
     """Get a parameter from a request.
@@ -471,78 +634,44 @@ def request_parameter(parameter, parameter_type=None, default=None,
     If the parameter is not found and no default is specified,
     or if the parameter is found but is of the wrong type
     then a Response object is returned
-    """
-    exp = Experiment(session)
 
-    # get the parameter
-    try:
-        value = request.values[parameter]
-    except KeyError:
-        # if it isnt found use the default, or return an error Response
-        if default is not None:
-            return default
-        elif optional:
-            return None
-        else:
-            msg = "{} {} request, {} not specified".format(
-                request.url, request.method, parameter)
-            return error_response(error_type=msg)
-
-    # check the parameter type
-    if parameter_type is None:
-        # if no parameter_type is required, return the parameter as is
-        return value
-    elif parameter_type == "int":
-        # if int is required, convert to an int
-        try:
-            value = int(value)
-            return value
-        except ValueError:
-            msg = "{} {} request, non-numeric {}: {}".format(
-                request.url, request.method, parameter, value)
-            return error_response(error_type=msg)
-    elif parameter_type == "known_class":
-        # if its a known class check against the known classes
-        try:
-            value = exp.known_classes[value]
-            return value
-        except KeyError:
-            msg = "{} {} request, unknown_class: {} for parameter {}".format(
-                request.url, request.method, value, parameter)
-            return error_response(error_type=msg)
-    elif parameter_type == "bool":
-        # if its a boolean, convert to a boolean
-        if value in ["True", "False"]:
-            return value == "True"
-        else:
-            msg = "{} {} request, non-boolean {}: {}".format(
-                request.url, request.method, parameter, value)
-            return error_response(error_type=msg)
-    else:
+    Routes should rather declare their parameters with :func:`parameters`.
+    """
+    if parameter_type not in PARAMETER_TYPES:
         msg = "/{} {} request, unknown parameter type: {} for parameter {}"\
             .format(request.url, request.method, parameter_type, parameter)
         return error_response(error_type=msg)
 
+    try:
+        return Parameter(parameter_type, default, optional).get(parameter)
+    except ValueError as e:
+        return parameter_error(e)
+
 
-def assign_properties(thing):
+#: The properties that can be assigned to objects created by requests.
+PROPERTIES = ["property{}".format(i + 1) for i in range(5)]
+
+
+def assign_properties(thing, values=None):
     """Assign properties to an object.
 
     When creating something via a post request (e.g. a node), you can pass the
     properties of the object in the request. This function gets those values
-    from the request and fills in the relevant columns of the table.
+    from the request, or from values if given, and fills in the relevant
+    columns of the table. It is up to the route to commit them.
     """
-    for p in range(5):
-        property_name = "property" + str(p + 1)
-        property = request_parameter(parameter=property_name, optional=True)
+    if values is None:
+        values = request.values
+
+    for property_name in PROPERTIES:
+        property = values.get(property_name)
         if property:
             setattr(thing, property_name, property)
 
-    session.commit()
-
 
 @app.route("/participant/<worker_id>/<hit_id>/<assignment_id>/<mode>",
            methods=["POST"])
-@db.serialized
+@db.exclusive
 def create_participant(worker_id, hit_id, assignment_id, mode):
     """Create a participant.
 
@@ -550,6 +679,11 @@ def create_participant(worker_id, hit_id, assignment_id, mode):
     defined in reference to the participant object. You must specify the
     worker_id, hit_id, assignment_id, and mode in the url.
     """
+    # In advisory mode participants are created one at a time, so that two
+    # requests can't both pass the checks below or count the same
+    # participants waiting
+    db.advisory_lock(models.PARTICIPANT_LOCK_NAMESPACE, 0)
+
     already_participated = models.Participant.query.\
         filter_by(worker_id=worker_id).one_or_none()
 
@@ -590,7 +724,7 @@ def create_participant(worker_id, hit_id, assignment_id, mode):
         'participant': participant.__json__()
     }
 
-    exp = Experiment(session)
+    exp = get_experiment()
 
     # Ping back to the recruiter that one of their participants has joined:
     recruiter = Recruiter.for_experiment(exp)
@@ -638,7 +772,10 @@ def get_network(network_id):
 
 
 @app.route("/question/<participant_id>", methods=["POST"])
-def create_question(participant_id):
+@parameters(question=Parameter(),
+            response=Parameter(),
+            number=Parameter("int"))
+def create_question(participant_id, question, response, number):
     """Send a POST request to the question table.
 
     Questions store information at the participant level, not the node
@@ -659,13 +796,6 @@ def create_question(participant_id):
         return error_response(error_type=error_type,
                               participant=ppt)
 
-    question = request_parameter(parameter="question")
-    response = request_parameter(parameter="response")
-    number = request_parameter(parameter="number", parameter_type="int")
-    for x in [question, response, number]:
-        if type(x) == Response:
-            return x
-
     try:
         # execute the request
         models.Question(participant=ppt, question=question,
@@ -680,7 +810,10 @@ def create_question(participant_id):
 
 
 @app.route("/node/<int:node_id>/neighbors", methods=["GET"])
-def node_neighbors(node_id):
+@parameters(node_type=Parameter("known_class", default=models.Node),
+            failed=Parameter("bool", default=False),
+            connection=Parameter(default="to"))
+def node_neighbors(node_id, node_type, failed, connection):
     """Send a GET request to the node table.
 
     This calls the neighbours method of the node
@@ -692,19 +825,7 @@ def node_neighbors(node_id):
     After getting the neighbours it also calls
     exp.node_get_request()
     """
-    exp = Experiment(session)
-
-    # get the parameters
-    node_type = request_parameter(parameter="node_type",
-                                  parameter_type="known_class",
-                                  default=models.Node)
-    failed = request_parameter(parameter="failed",
-                               parameter_type="bool",
-                               default=False)
-    connection = request_parameter(parameter="connection", default="to")
-    for x in [node_type, failed, connection]:
-        if type(x) == Response:
-            return x
+    exp = get_experiment()
 
     # make sure the node exists
     node = models.Node.query.get(node_id)
@@ -733,7 +854,7 @@ def node_neighbors(node_id):
 
 
 @app.route("/node/<participant_id>", methods=["POST"])
-@db.serialized
+@db.exclusive
 def create_node(participant_id):
     """Send a POST request to the node table.
 
@@ -743,7 +864,7 @@ def create_node(participant_id):
         3. exp.add_node_to_network
         4. exp.node_post_request
     """
-    exp = Experiment(session)
+    exp = get_experiment()
 
     # Get the participant.
     try:
@@ -783,21 +904,16 @@ def create_node(participant_id):
 
 
 @app.route("/node/<int:node_id>/vectors", methods=["GET"])
-def node_vectors(node_id):
+@parameters(direction=Parameter(default="all"),
+            failed=Parameter("bool", default=False))
+def node_vectors(node_id, direction, failed):
     """Get the vectors of a node.
 
     You must specify the node id in the url.
     You can pass direction (incoming/outgoing/all) and failed
     (True/False/all).
     """
-    exp = Experiment(session)
-    # get the parameters
-    direction = request_parameter(parameter="direction", default="all")
-    failed = request_parameter(parameter="failed",
-                               parameter_type="bool", default=False)
-    for x in [direction, failed]:
-        if type(x) == Response:
-            return x
+    exp = get_experiment()
 
     # execute the request
     node = models.Node.query.get(node_id)
@@ -819,18 +935,14 @@ def node_vectors(node_id):
 
 @app.route("/node/<int:node_id>/connect/<int:other_node_id>",
            methods=["POST"])
-def connect(node_id, other_node_id):
+@parameters(direction=Parameter(default="to"))
+def connect(node_id, other_node_id, direction):
     """Connect to another node.
 
     The ids of both nodes must be speficied in the url.
     You can also pass direction (to/from/both) as an argument.
     """
-    exp = Experiment(session)
-
-    # get the parameters
-    direction = request_parameter(parameter="direction", default="to")
-    if type(direction == Response):
-        return direction
+    exp = get_experiment()
 
     # check the nodes exist
     node = models.Node.query.get(node_id)
@@ -869,7 +981,7 @@ def get_info(node_id, info_id):
 
     Both the node and info id must be specified in the url.
     """
-    exp = Experiment(session)
+    exp = get_experiment()
 
     # check the node exists
     node = models.Node.query.get(node_id)
@@ -903,20 +1015,17 @@ def get_info(node_id, info_id):
 
 
 @app.route("/node/<int:node_id>/infos", methods=["GET"])
-def node_infos(node_id):
+@parameters(info_type=Parameter("known_class", default=models.Info),
+            after_id=Parameter("int", optional=True),
+            limit=Parameter("count", optional=True))
+def node_infos(node_id, info_type, after_id, limit):
     """Get all the infos of a node.
 
     The node id must be specified in the url.
-    You can also pass info_type.
+    You can also pass info_type. To fetch the infos a page at a time, pass
+    limit, and after_id set to the id of the last info already fetched.
     """
-    exp = Experiment(session)
-
-    # get the parameters
-    info_type = request_parameter(parameter="info_type",
-                                  parameter_type="known_class",
-                                  default=models.Info)
-    if type(info_type) == Response:
-        return info_type
+    exp = get_experiment()
 
     # check the node exists
     node = models.Node.query.get(node_id)
@@ -925,7 +1034,7 @@ def node_infos(node_id):
 
     try:
         # execute the request:
-        infos = node.infos(type=info_type)
+        infos = node.infos(type=info_type, after_id=after_id, limit=limit)
 
         # ping the experiment
         exp.info_get_request(
@@ -942,28 +1051,31 @@ def node_infos(node_id):
 
 
 @app.route("/node/<int:node_id>/received_infos", methods=["GET"])
-def node_received_infos(node_id):
+@parameters(info_type=Parameter("known_class", default=models.Info),
+            since=Parameter("since", optional=True))
+def node_received_infos(node_id, info_type, since):
     """Get all the infos a node has been sent and has received.
 
     You must specify the node id in the url.
-    You can also pass the info type.
+    You can also pass the info type. The response includes since, the
+    receive_order of the latest transmission the node received; pass it back
+    as since to only get the infos received after that. since can also be a
+    time (in ISO format) to get the infos received after it.
     """
-    exp = Experiment(session)
-
-    # get the parameters
-    info_type = request_parameter(parameter="info_type",
-                                  parameter_type="known_class",
-                                  default=models.Info)
-    if type(info_type) == Response:
-        return info_type
+    exp = get_experiment()
 
     # check the node exists
     node = models.Node.query.get(node_id)
     if node is None:
         return error_response(error_type="/node/infos, node does not exist")
 
-    # execute the request:
-    infos = node.received_infos(type=info_type)
+    # execute the request, reading the watermark first so that infos
+    # received meanwhile are returned again next time rather than skipped
+    watermark = models.Transmission.query\
+        .with_entities(func.max(models.Transmission.receive_order))\
+        .filter_by(destination_id=node.id, status="received", failed=False)\
+        .scalar()
+    infos = node.received_infos(type=info_type, since=since)
 
     try:
         # ping the experiment
@@ -977,11 +1089,14 @@ def node_received_infos(node_id):
                               status=403,
                               participant=node.participant)
 
-    return success_response(infos=[i.__json__() for i in infos])
+    return success_response(infos=[i.__json__() for i in infos],
+                            since=watermark)
 
 
 @app.route("/info/<int:node_id>", methods=["POST"])
-def info_post(node_id):
+@parameters(info_type=Parameter("known_class", default=models.Info),
+            contents=Parameter())
+def info_post(node_id, info_type, contents):
     """Create an info.
 
     The node id must be specified in the url.
@@ -991,16 +1106,7 @@ def info_post(node_id):
     If info_type is a custom subclass of Info it must be
     added to the known_classes of the experiment class.
     """
-    exp = Experiment(session)
-
-    # get the parameters
-    info_type = request_parameter(parameter="info_type",
-                                  parameter_type="known_class",
-                                  default=models.Info)
-    contents = request_parameter(parameter="contents")
-    for x in [info_type, contents]:
-        if type(x) == Response:
-            return x
+    exp = get_experiment()
 
     # check the node exists
     node = models.Node.query.get(node_id)
@@ -1028,21 +1134,22 @@ def info_post(node_id):
 
 
 @app.route("/node/<int:node_id>/transmissions", methods=["GET"])
-def node_transmissions(node_id):
+@parameters(direction=Parameter(default="incoming"),
+            status=Parameter(default="all"),
+            after_id=Parameter("int", optional=True),
+            limit=Parameter("count", optional=True),
+            since=Parameter("since", optional=True))
+def node_transmissions(node_id, direction, status, after_id, limit, since):
     """Get all the transmissions of a node.
 
     The node id must be specified in the url.
     You can also pass direction (to/from/all) or status (all/pending/received)
-    as arguments.
+    as arguments. To fetch the transmissions a page at a time, pass limit,
+    and after_id set to the id of the last transmission already fetched.
+    To only get transmissions newer than those already fetched, pass since,
+    the id or creation time (in ISO format) of the latest one.
     """
-    exp = Experiment(session)
-
-    # get the parameters
-    direction = request_parameter(parameter="direction", default="incoming")
-    status = request_parameter(parameter="status", default="all")
-    for x in [direction, status]:
-        if type(x) == Response:
-            return x
+    exp = get_experiment()
 
     # check the node exists
     node = models.Node.query.get(node_id)
@@ -1051,7 +1158,9 @@ def node_transmissions(node_id):
             error_type="/node/transmissions, node does not exist")
 
     # execute the request
-    transmissions = node.transmissions(direction=direction, status=status)
+    transmissions = node.transmissions(direction=direction, status=status,
+                                       since=since,
+                                       after_id=after_id, limit=limit)
 
     try:
         if direction in ["incoming", "all"] and status in ["pending", "all"]:
@@ -1070,8 +1179,35 @@ def node_transmissions(node_id):
     return success_response(transmissions=[t.__json__() for t in transmissions])
 
 
+def transmit_argument(value, model, description):
+    """Convert the what or to_whom parameter of a transmit request.
+
+    An int is the id of an object of type model, anything else is the name of
+    one of the experiment's known_classes. Raise a ValueError if there is no
+    such object or class.
+    """
+    if value is None:
+        return None
+
+    try:
+        object_id = int(value)
+    except ValueError:
+        try:
+            return get_experiment().known_classes[value]
+        except KeyError:
+            raise ValueError("{} not in experiment.known_classes"
+                             .format(value))
+
+    thing = model.query.get(object_id)
+    if thing is None:
+        raise ValueError("{} does not exist".format(description))
+    return thing
+
+
 @app.route("/node/<int:node_id>/transmit", methods=["POST"])
-def node_transmit(node_id):
+@parameters(what=Parameter(optional=True),
+            to_whom=Parameter(optional=True))
+def node_transmit(node_id, what, to_whom):
     """Transmit to another node.
 
     The sender's node id must be specified in the url.
@@ -1102,56 +1238,28 @@ def node_transmit(node_id):
         },
     });
     """
-    exp = Experiment(session)
-    what = request_parameter(parameter="what", optional=True)
-    to_whom = request_parameter(parameter="to_whom", optional=True)
+    exp = get_experiment()
 
     # check the node exists
     node = models.Node.query.get(node_id)
     if node is None:
         return error_response(error_type="/node/transmit, node does not exist")
-    # create what
-    if what is not None:
-        try:
-            what = int(what)
-            what = models.Info.query.get(what)
-            if what is None:
-                return error_response(
-                    error_type="/node/transmit POST, info does not exist",
-                    participant=node.participant)
-        except Exception:
-            try:
-                what = exp.known_classes[what]
-            except KeyError:
-                msg = '/node/transmit POST, {} not in experiment.known_classes'
-                return error_response(
-                    error_type=msg.format(what),
-                    participant=node.participant)
 
-    # create to_whom
-    if to_whom is not None:
-        try:
-            to_whom = int(to_whom)
-            to_whom = models.Node.query.get(to_whom)
-            if to_whom is None:
-                return error_response(
-                    error_type="/node/transmit POST, recipient Node does not exist",
-                    participant=node.participant)
-        except Exception:
-            try:
-                to_whom = exp.known_classes[to_whom]
-            except KeyError:
-                msg = '/node/transmit POST, {} not in experiment.known_classes'
-                return error_response(
-                    error_type=msg.format(to_whom),
-                    participant=node.participant)
+    # create what and to_whom
+    try:
+        what = transmit_argument(what, models.Info, "info")
+        to_whom = transmit_argument(to_whom, models.Node, "recipient Node")
+    except ValueError as e:
+        return error_response(
+            error_type="/node/transmit POST, {}".format(e),
+            participant=node.participant)
 
     # execute the request
     try:
         transmissions = node.transmit(what=what, to_whom=to_whom)
         for t in transmissions:
             assign_properties(t)
-        session.commit()
+
         # ping the experiment
         exp.transmission_post_request(
             node=node,
@@ -1166,21 +1274,16 @@ def node_transmit(node_id):
 
 
 @app.route("/node/<int:node_id>/transformations", methods=["GET"])
-def transformation_get(node_id):
+@parameters(transformation_type=Parameter("known_class",
+                                          default=models.Transformation))
+def transformation_get(node_id, transformation_type):
     """Get all the transformations of a node.
 
     The node id must be specified in the url.
 
     You can also pass transformation_type.
     """
-    exp = Experiment(session)
-
-    # get the parameters
-    transformation_type = request_parameter(parameter="transformation_type",
-                                            parameter_type="known_class",
-                                            default=models.Transformation)
-    if type(transformation_type) == Response:
-        return transformation_type
+    exp = get_experiment()
 
     # check the node exists
     node = models.Node.query.get(node_id)
@@ -1207,20 +1310,16 @@ def transformation_get(node_id):
 @app.route(
     "/transformation/<int:node_id>/<int:info_in_id>/<int:info_out_id>",
     methods=["POST"])
-def transformation_post(node_id, info_in_id, info_out_id):
+@parameters(transformation_type=Parameter("known_class",
+                                          default=models.Transformation))
+def transformation_post(node_id, info_in_id, info_out_id,
+                        transformation_type):
     """Transform an info.
 
     The ids of the node, info in and info out must all be in the url.
     You can also pass transformation_type.
     """
-    exp = Experiment(session)
-
-    # Get the parameters.
-    transformation_type = request_parameter(parameter="transformation_type",
-                                            parameter_type="known_class",
-                                            default=models.Transformation)
-    if type(transformation_type) == Response:
-        return transformation_type
+    exp = get_experiment()
 
     # Check that the node etc. exists.
     node = models.Node.query.get(node_id)
@@ -1245,7 +1344,6 @@ def transformation_post(node_id, info_in_id, info_out_id):
         transformation = transformation_type(info_in=info_in,
                                              info_out=info_out)
         assign_properties(transformation)
-        session.commit()
 
         # ping the experiment
         exp.transformation_post_request(node=node,
@@ -1259,6 +1357,145 @@ def transformation_post(node_id, info_in_id, info_out_id):
     return success_response(transformation=transformation.__json__())
 
 
+def _get(model, object_id, description):
+    """Get an object by id for /batch, raising ValueError if it is missing."""
+    thing = model.query.get(object_id)
+    if thing is None:
+        raise ValueError("{} does not exist".format(description))
+    return thing
+
+
+def _batch_info(exp, node_id, info_type, contents, values):
+    node = _get(models.Node, node_id, "node")
+    info = info_type(origin=node, contents=contents)
+    assign_properties(info, values)
+    return ({"info": info},
+            lambda: exp.info_post_request(node=node, info=info))
+
+
+def _batch_question(exp, participant_id, question, response, number, values):
+    participant = _get(models.Participant, participant_id, "participant")
+    if (participant.status != "working" and
+            config.get('mode', None) != 'debug'):
+        raise ValueError("participant status = {}".format(participant.status))
+    question = models.Question(participant=participant, question=question,
+                               response=response, number=number)
+    return {"question": question}, None
+
+
+def _batch_transmit(exp, node_id, what, to_whom, values):
+    node = _get(models.Node, node_id, "node")
+    what = transmit_argument(what, models.Info, "info")
+    to_whom = transmit_argument(to_whom, models.Node, "recipient Node")
+    transmissions = node.transmit(what=what, to_whom=to_whom)
+    for t in transmissions:
+        assign_properties(t, values)
+    return ({"transmissions": transmissions},
+            lambda: exp.transmission_post_request(
+                node=node, transmissions=transmissions))
+
+
+def _batch_transformation(exp, node_id, info_in_id, info_out_id,
+                          transformation_type, values):
+    node = _get(models.Node, node_id, "node")
+    info_in = _get(models.Info, info_in_id, "info_in")
+    info_out = _get(models.Info, info_out_id, "info_out")
+    transformation = transformation_type(info_in=info_in, info_out=info_out)
+    assign_properties(transformation, values)
+    return ({"transformation": transformation},
+            lambda: exp.transformation_post_request(
+                node=node, transformation=transformation))
+
+
+#: The operations /batch can run: for each type, the parameters of the
+#: operation and the function that runs it.
+BATCH_OPERATIONS = {
+    "info": (
+        {"node_id": Parameter("int"),
+         "info_type": Parameter("known_class", default=models.Info),
+         "contents": Parameter()},
+        _batch_info),
+    "question": (
+        {"participant_id": Parameter("int"),
+         "question": Parameter(),
+         "response": Parameter(),
+         "number": Parameter("int")},
+        _batch_question),
+    "transmit": (
+        {"node_id": Parameter("int"),
+         "what": Parameter(optional=True),
+         "to_whom": Parameter(optional=True)},
+        _batch_transmit),
+    "transformation": (
+        {"node_id": Parameter("int"),
+         "info_in_id": Parameter("int"),
+         "info_out_id": Parameter("int"),
+         "transformation_type": Parameter("known_class",
+                                          default=models.Transformation)},
+        _batch_transformation),
+}
+
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    """Create several infos, questions, transmissions and transformations.
+
+    The body of the request must be a JSON list of operations. Each one is an
+    object with a type ("info", "question", "transmit" or "transformation")
+    and the parameters of the matching route, including the ids that are
+    usually in its url. For example:
+
+        [{"type": "info", "node_id": 5, "contents": "foo"},
+         {"type": "transmit", "node_id": 5, "what": "Info", "to_whom": 6}]
+
+    All the operations run in one transaction and the experiment's
+    *_post_request methods are only called once they have all been done.
+    If any of them fails nothing is saved. The results of the operations
+    are returned in order.
+    """
+    exp = get_experiment()
+
+    operations = request.get_json(silent=True)
+    if not isinstance(operations, list):
+        return error_response(
+            error_type="/batch POST, request is not a JSON list")
+
+    results = []
+    hooks = []
+    try:
+        for number, operation in enumerate(operations):
+            try:
+                schema, run = BATCH_OPERATIONS[operation["type"]]
+                kw = parse_parameters(schema, operation)
+                result, hook = run(exp, values=operation, **kw)
+            except (KeyError, TypeError, ValueError) as e:
+                session.rollback()
+                return error_response(
+                    error_type="/batch POST, operation {} failed: {!r}"
+                    .format(number, e))
+            results.append(result)
+            if hook is not None:
+                hooks.append(hook)
+
+        # ping the experiment
+        for hook in hooks:
+            hook()
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        return error_response(error_type="/batch POST server error",
+                              status=403)
+
+    # return the data
+    return success_response(results=[
+        dict((key, [t.__json__() for t in value] if isinstance(value, list)
+              else value.__json__())
+             for key, value in result.items())
+        for result in results
+    ])
+
+
 @app.route("/notifications", methods=["POST", "GET"])
 def api_notifications():
     """Receive MTurk REST notifications."""
@@ -1366,7 +1603,7 @@ def worker_function(event_type, assignment_id, participant_id):
     except AttributeError:
         db.logger.debug('Debug worker_function called synchronously')
 
-    exp = Experiment(session)
+    exp = get_experiment()
     key = "-----"
 
     exp.log("Received an {} notification for assignment {}, participant {}"
@@ -4,6 +4,7 @@ from gunicorn.app.base import Application
 from gunicorn import util
 import multiprocessing
 import os
+from dallinger import db
 from dallinger.config import get_config
 import logging
 
@@ -17,6 +18,12 @@ def when_ready(arbiter):
     logger.warn('Ready.')
 
 
+def post_fork(server, worker):
+    # The engine was created when the master imported dallinger.db, before
+    # it loaded the configuration, so each worker builds its own
+    db.configure_engine()
+
+
 class StandaloneServer(Application):
     loglevels = ["debug", "info", "warning", "error", "critical"]
 
@@ -59,6 +66,13 @@ class StandaloneServer(Application):
         if workers == "auto":
             workers = str(multiprocessing.cpu_count() * 2 + 1)
 
+        budget = db.pool_budget()
+        if budget is not None:
+            logger.info(
+                'Database pool: up to {} connections per dyno '
+                '({} workers with {} each)'.format(
+                    int(workers) * budget, workers, budget))
+
         host = config.get("host")
         bind_address = "{}:{}".format(host, self.port)
         self.options = {
@@ -72,6 +86,7 @@ class StandaloneServer(Application):
             'proc_name': 'dallinger_experiment_server',
             'limit_request_line': '0',
             'when_ready': when_ready,
+            'post_fork': post_fork,
         }
 
 
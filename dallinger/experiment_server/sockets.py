@@ -1,5 +1,7 @@
 from collections import defaultdict
+from collections import deque
 from .experiment_server import app
+from .. import db
 from ..heroku.worker import conn
 from flask import request
 from flask_sockets import Sockets
@@ -12,6 +14,12 @@ sockets = Sockets(app)
 
 HEARTBEAT_DELAY = 30
 
+# At most this many greenlets send messages to clients at once
+SENDERS = 10
+
+# Messages waiting for a slow client beyond this many are dropped, oldest first
+CLIENT_QUEUE_SIZE = 100
+
 
 def log(msg, level='info'):
     # Log including pid and greenlet id
@@ -25,13 +33,26 @@ class ChatBackend(object):
 
     This is run by each web process; all processes receive the messages.
 
+    Each message is encoded once and queued for each client on its channel.
+    A few sender greenlets take turns draining the queues of the clients
+    with pending messages, so a slow client doesn't hold up the others.
+
     Inspired by https://devcenter.heroku.com/articles/python-websockets
     """
 
     def __init__(self):
         self.pubsub = conn.pubsub()
-        self.clients = defaultdict(list)
+        self.clients = defaultdict(set)
+        self.channels = defaultdict(set)
+        # The clients that are websockets, which the heartbeat keeps alive
+        self.sockets = set()
         self.greenlet = None
+        self.heartbeat_greenlet = None
+        # Messages waiting to be sent to each client, and the clients that
+        # have some in the order they got them
+        self.pending = {}
+        self.ready = deque()
+        self.senders = 0
 
     def subscribe(self, client, channel):
         """Register a new client to receive messages on a channel."""
@@ -49,26 +70,68 @@ class ChatBackend(object):
         if self.greenlet is None:
             self.start()
 
-        self.clients[channel].append(client)
+        self.clients[channel].add(client)
+        self.channels[client].add(channel)
         log('Subscribed client {} to channel {}'.format(client, channel))
 
+    def connect(self, ws, channel):
+        """Register a websocket to receive messages on a channel."""
+        self.sockets.add(ws)
+        self.subscribe(ws, channel)
+
     def unsubscribe(self, client, channel):
         if client in self.clients[channel]:
-            self.clients[channel].remove(client)
+            self.clients[channel].discard(client)
+            self.channels[client].discard(channel)
             log('Removed client {} from channel {}'.format(client, channel))
 
+    def remove(self, client):
+        """Unsubscribe a client from all its channels."""
+        for channel in self.channels.pop(client, ()):
+            self.clients[channel].discard(client)
+        self.sockets.discard(client)
+        self.pending.pop(client, None)
+        log('Removed client {}'.format(client))
+
     def send(self, client, data):
         """Send data to one client.
 
-        Automatically discards invalid connections.
+        Automatically discards invalid connections. Returns whether the
+        data was sent.
         """
         try:
-            client.send(data.decode('utf-8'))
+            client.send(data)
         except socket.error:
-            for channel in self.clients:
-                self.unsubscribe(client, channel)
-        else:
-            log('Sent to {}: {}'.format(client, data), level='debug')
+            self.remove(client)
+            return False
+        return True
+
+    def enqueue(self, client, data):
+        """Queue data to be sent to one client by a sender greenlet."""
+        queue = self.pending.get(client)
+        if queue is None:
+            queue = self.pending[client] = deque(maxlen=CLIENT_QUEUE_SIZE)
+            self.ready.append(client)
+            if self.senders < SENDERS:
+                self.senders += 1
+                gevent.spawn(self.drain)
+        elif len(queue) == queue.maxlen:
+            log('Client {} is too slow, dropping a message'.format(client),
+                level='warning')
+        queue.append(data)
+
+    def drain(self):
+        """Send the pending messages of ready clients until there are none."""
+        try:
+            while self.ready:
+                client = self.ready.popleft()
+                queue = self.pending.get(client, ())
+                while queue:
+                    if not self.send(client, queue.popleft()):
+                        break
+                self.pending.pop(client, None)
+        finally:
+            self.senders -= 1
 
     def run(self):
         """Listens for new messages in redis, and sends them to clients."""
@@ -77,26 +140,46 @@ class ChatBackend(object):
             data = message.get('data')
             if message['type'] == 'message' and data != 'None':
                 channel = message['channel']
-                count = len(self.clients[channel])
-                if count:
-                    for client in self.clients[channel]:
-                        gevent.spawn(
-                            self.send, client, '{}:{}'.format(channel, data))
+                clients = self.clients[channel]
+                if clients:
+                    payload = '{}:{}'.format(channel, data).decode('utf-8')
+                    log('Sending to {} clients: {}'.format(
+                        len(clients), payload), level='debug')
+                    for client in clients:
+                        self.enqueue(client, payload)
 
     def start(self):
-        """Starts listening in the background."""
+        """Starts listening and sending heartbeats in the background."""
         self.greenlet = gevent.spawn(self.run)
+        self.heartbeat_greenlet = gevent.spawn(self.heartbeat)
 
     def stop(self):
         if self.greenlet is not None:
             self.greenlet.kill()
             self.greenlet = None
+        if self.heartbeat_greenlet is not None:
+            self.heartbeat_greenlet.kill()
+            self.heartbeat_greenlet = None
 
-    def heartbeat(self, ws):
-        """Send a ping to the websocket client periodically"""
-        while not ws.closed:
+    def heartbeat(self):
+        """Ping all clients periodically, so Heroku won't close the
+        connections, and forget the clients whose connection was closed.
+        """
+        while True:
             gevent.sleep(HEARTBEAT_DELAY)
-            gevent.spawn(self.send, ws, 'ping')
+            self.sweep()
+
+    def sweep(self):
+        """Ping the live websockets and remove the closed ones, in one pass.
+
+        Other clients, like the experiment, are subscribed for as long as the
+        process runs.
+        """
+        for ws in list(self.sockets):
+            if ws.closed:
+                self.remove(ws)
+            else:
+                self.enqueue(ws, 'ping')
 
 
 chat_backend = ChatBackend()
@@ -108,19 +191,19 @@ def chat(ws):
     """
     # Subscribe to messages on the specified channel.
     channel = request.args.get('channel')
-    lag_tolerance_secs = float(request.args.get('tolerance', 0.1))
-    chat_backend.subscribe(ws, channel)
-
-    # Send heartbeat ping every 30s
-    # so Heroku won't close the connection
-    gevent.spawn(chat_backend.heartbeat, ws)
+    chat_backend.connect(ws, channel)
 
     while not ws.closed:
-        # Sleep to prevent *constant* context-switches.
-        gevent.sleep(lag_tolerance_secs)
-
-        # Publish messages from client
+        # Wait for the next message from the client, other greenlets run
+        # meanwhile. None means the socket was closed.
         message = ws.receive()
-        if message is not None:
-            channel, data = message.split(':', 1)
-            conn.publish(channel, data)
+        if message is None:
+            break
+
+        # Publish messages from client, together with those that other
+        # clients sent meanwhile. This is always done in the background,
+        # whatever publish_in_background says, as sockets are served by gevent.
+        channel, data = message.split(':', 1)
+        db.publish_in_background([(channel, data)])
+
+    chat_backend.remove(ws)
@@ -53,6 +53,33 @@ var Dallinger = (function () {
   };
 
 
+  // Run several create operations (infos, questions, transmissions and
+  // transformations) in a single request, see the /batch route.
+  dlgr.batch = function (operations) {
+    var deferred = $.Deferred();
+
+    reqwest({
+      method: "post",
+      url: "/batch",
+      contentType: "application/json",
+      data: JSON.stringify(operations),
+      type: "json",
+      success: function (resp) {
+        deferred.resolve(resp.results);
+      },
+      error: function (err) {
+        deferred.reject();
+        var errorResponse = JSON.parse(err.response);
+        if (errorResponse.hasOwnProperty("html")) {
+          $("body").html(errorResponse.html);
+        }
+      }
+    });
+
+    return deferred;
+  };
+
+
   dlgr.BusyForm = (function () {
 
     /**
@@ -237,8 +264,9 @@ var create_participant = function() {
 var lock = false;
 
 var submitResponses = function () {
-    submitNextResponse(0);
-    submitAssignment();
+    // the assignment is submitted even if saving the answers failed, as it
+    // was when each answer was sent on its own
+    submitAllResponses().always(submitAssignment);
 };
 
 var submit_responses = function () {
@@ -246,6 +274,26 @@ var submit_responses = function () {
     submitAssignment();
 };
 
+// submit the answers to all the questions in a single request
+var submitAllResponses = function () {
+    var fields = $(
+        "form .question select, form .question input, form .question textarea"
+    ).filter("[name]");
+    var operations = fields.map(
+        function (n) {
+            return {
+                type: "question",
+                participant_id: participant_id,
+                question: $(this).attr("name"),
+                number: n + 1,
+                response: $(this).val()
+            };
+        }
+    ).get();
+
+    return Dallinger.batch(operations);
+};
+
 var submitNextResponse = function (n) {
 
     // Get all the ids.
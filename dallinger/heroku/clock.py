@@ -154,6 +154,7 @@ def check_db_for_missing_notifications():
 def launch():
     if not config.ready:
         config.load()
+        db.configure_engine()
     scheduler.start()
 
 
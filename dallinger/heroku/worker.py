@@ -17,6 +17,15 @@ redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
 conn = redis.from_url(redis_url)
 
 if __name__ == '__main__':
+    from dallinger import db
+    from dallinger.config import get_config
+
+    # Size the database pool from the configuration before running any jobs
+    config = get_config()
+    if not config.ready:
+        config.load()
+    db.configure_engine()
+
     with Connection(conn):
         worker = Worker(list(map(Queue, listen)))
         worker.work()
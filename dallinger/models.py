@@ -1,9 +1,12 @@
 """Define Dallinger's core models."""
 
+from collections import defaultdict
 from datetime import datetime
 import inspect
+from itertools import chain
 
-from sqlalchemy import ForeignKey, or_, and_
+from sqlalchemy import ForeignKey, or_, and_, tuple_
+from sqlalchemy import event
 from sqlalchemy import (
     Column,
     String,
@@ -12,21 +15,303 @@ from sqlalchemy import (
     Integer,
     Boolean,
     DateTime,
-    Float
+    Float,
+    BigInteger,
+    Index,
+    Sequence
 )
-from sqlalchemy.sql.expression import false
+from sqlalchemy.sql.expression import false, text
 from sqlalchemy.orm import relationship, validates
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
+from . import db
 from .db import Base
+from .db import session
 
 DATETIME_FMT = "%Y-%m-%dT%H:%M:%S.%f"
 
 
+#: Predicate of the partial indexes that only cover not-failed rows, which is
+#: what almost every query in this module asks for.
+NOT_FAILED = text("failed = false")
+
+#: The namespace of the advisory locks taken by Network.lock().
+NETWORK_LOCK_NAMESPACE = 1
+
+#: The namespace of the advisory lock taken while creating a participant.
+PARTICIPANT_LOCK_NAMESPACE = 2
+
+#: How many rows the streaming getters load from the database at a time.
+STREAM_BATCH_SIZE = 1000
+
+#: Numbers transmissions in the order they are received, unlike their ids
+#: which follow the order they were sent in.
+RECEIVE_ORDER = Sequence("transmission_receive_order_seq",
+                         metadata=Base.metadata)
+
+
 def timenow():
     """A string representing the current date and time."""
     return datetime.now()
 
 
+def hybrid_property_index(cls, *properties, **kwargs):
+    """Declare an index on the SQL expressions of some hybrid properties.
+
+    Hybrid properties such as :attr:`~dallinger.nodes.Agent.fitness` are
+    stored as strings in ``property1..5`` and cast in SQL, so a query that
+    filters on them can't use a regular index. This declares a functional
+    index on ``cls`` (a subclass of one of the models above) over the given
+    hybrid properties and columns, e.g.::
+
+        hybrid_property_index(RogersAgent, "network_id", "generation")
+
+    The index only covers not-failed rows of ``cls`` and the subclasses it
+    has at the time of the call, so other types are free to store anything
+    in the same column. Declare it after all the subclasses of ``cls``:
+    queries made through a subclass declared later will not use it. The
+    name of the index can be given as ``name``.
+
+    Indexes declared after their table was created are created by
+    :func:`~dallinger.db.init_db`.
+    """
+    mapper = cls.__mapper__
+    table = mapper.local_table
+    name = kwargs.pop("name", None)
+    if name is None:
+        name = "ix_{}_{}_{}".format(
+            table.name, mapper.polymorphic_identity, "_".join(properties))
+
+    expressions = []
+    for prop in properties:
+        expression = getattr(cls, prop)
+        if hasattr(expression, "__clause_element__"):
+            expression = expression.__clause_element__()
+        expressions.append(expression)
+
+    where = table.c.failed == false()
+    if mapper.polymorphic_on is not None:
+        identities = [m.polymorphic_identity
+                      for m in mapper.self_and_descendants]
+        where = and_(where, mapper.polymorphic_on.in_(identities))
+
+    return Index(name, *expressions, postgresql_where=where)
+
+
+def _bulk_insert(model, rows):
+    """Insert rows with a single multi-row INSERT.
+
+    Return the new rows as objects of ``model``, in the order of ``rows``.
+    Unlike adding objects to the session, this doesn't call ``__init__``, so
+    callers are responsible for validating the rows.
+    """
+    if not rows:
+        return []
+
+    table = model.__table__
+    result = session.execute(
+        table.insert().values(rows).returning(table.c.id))
+    ids = [row.id for row in result]
+    objects = dict((o.id, o) for o in model.query.filter(model.id.in_(ids)))
+    return [objects[i] for i in ids]
+
+
+def _fetch(query, model, after_id=None, limit=None, stream=False):
+    """Run the query of a getter.
+
+    By default all results are returned as a list. If ``after_id`` or
+    ``limit`` are given, a single page of results is returned, ordered by
+    id, starting after ``after_id`` (keyset pagination). If ``stream`` is
+    True, an iterator is returned that loads the results in batches of
+    ``STREAM_BATCH_SIZE`` rather than all at once.
+    """
+    if limit is not None and (not isinstance(limit, int) or limit < 0):
+        raise ValueError("limit must be a non-negative integer, not {}"
+                         .format(limit))
+
+    if after_id is not None or limit is not None:
+        query = query.order_by(None).order_by(model.id)
+        if after_id is not None:
+            query = query.filter(model.id > after_id)
+        if limit is not None:
+            query = query.limit(limit)
+
+    if stream:
+        return iter(query.yield_per(STREAM_BATCH_SIZE))
+    return query.all()
+
+
+def _since(query, model, since):
+    """Restrict a query to rows created after a watermark.
+
+    ``since`` can be a datetime, compared with ``creation_time``, or an id.
+    """
+    if since is None:
+        return query
+    if isinstance(since, datetime):
+        return query.filter(model.creation_time > since)
+    return query.filter(model.id > since)
+
+
+def _bulk_fail(query, time_of_death):
+    """Fail the not-failed rows matched by a query with a single UPDATE.
+
+    Objects already loaded in the session have their ``failed`` and
+    ``time_of_death`` attributes expired, so they are refreshed on next
+    access.
+    """
+    return query\
+        .filter_by(failed=False)\
+        .update({"failed": True, "time_of_death": time_of_death},
+                synchronize_session="fetch")
+
+
+def _bulk_fail_node_cascade(node_ids, time_of_death):
+    """Fail everything that depends on some nodes with set-based UPDATEs.
+
+    This has the same effect as calling ``fail()`` on every not-failed
+    vector connected to the nodes, info made by them, transmission to or
+    from them and transformation made by them (or involving one of their
+    infos), but runs a handful of statements instead of one per row.
+    """
+    if not node_ids:
+        return
+
+    info_ids = [i.id for i in Info.query
+                .with_entities(Info.id)
+                .filter(Info.origin_id.in_(node_ids), Info.failed == false())
+                .all()]
+
+    _bulk_fail(
+        Vector.query.filter(or_(Vector.origin_id.in_(node_ids),
+                                Vector.destination_id.in_(node_ids))),
+        time_of_death)
+    _bulk_fail(
+        Transmission.query.filter(or_(Transmission.origin_id.in_(node_ids),
+                                      Transmission.destination_id.in_(node_ids))),
+        time_of_death)
+
+    transformations = Transformation.node_id.in_(node_ids)
+    if info_ids:
+        _bulk_fail(Info.query.filter(Info.id.in_(info_ids)), time_of_death)
+        transformations = or_(transformations,
+                              Transformation.info_in_id.in_(info_ids),
+                              Transformation.info_out_id.in_(info_ids))
+    _bulk_fail(Transformation.query.filter(transformations), time_of_death)
+
+
+def update_node_counts():
+    """Recount the not-failed nodes of every network.
+
+    Databases created before ``Network.node_count`` existed get the column
+    here, and their networks get their actual counts rather than 0.
+    """
+    session.execute(
+        "ALTER TABLE network "
+        "ADD COLUMN IF NOT EXISTS node_count integer NOT NULL DEFAULT 0")
+    session.execute(
+        "UPDATE network SET node_count = ("
+        "    SELECT count(*) FROM node"
+        "    WHERE node.network_id = network.id AND NOT node.failed)")
+
+
+def update_receive_order():
+    """Number the received transmissions that have no receive_order.
+
+    Databases created before ``Transmission.receive_order`` existed get the
+    column here. Their received transmissions are numbered ahead of any
+    received from now on.
+    """
+    session.execute(
+        "ALTER TABLE transmission "
+        "ADD COLUMN IF NOT EXISTS receive_order bigint")
+    session.execute(
+        "UPDATE transmission "
+        "SET receive_order = nextval('transmission_receive_order_seq') "
+        "WHERE status = 'received' AND receive_order IS NULL")
+
+
+class AdjacencyIndex(object):
+    """An in-memory directed graph of the not-failed vectors in a network.
+
+    The vectors of a node are loaded with a single query the first time it
+    asks about its connections, so only the nodes that are asked about are
+    loaded. The index is kept in ``session.info`` for the rest of the
+    transaction, updated as vectors are created and failed, and discarded on
+    commit or rollback.
+    """
+
+    def __init__(self):
+        self.outgoing = defaultdict(list)
+        self.incoming = defaultdict(list)
+        # The nodes whose vectors have all been loaded, and those vectors
+        self.loaded = set()
+        self.known = set()
+
+    @classmethod
+    def for_node(cls, network_id, node_id):
+        """Get the index of a network, loading the node's vectors if needed."""
+        index = cls.cached(network_id)
+        if index is None or node_id not in index.loaded:
+            # Run the query before touching session.info: if it starts a new
+            # transaction, the after_begin hook resets the cache.
+            vectors = Vector.query\
+                .filter_by(network_id=network_id, failed=False)\
+                .filter(or_(Vector.origin_id == node_id,
+                            Vector.destination_id == node_id))\
+                .all()
+            indexes = session.info.setdefault('adjacency', {})
+            index = indexes.setdefault(network_id, cls())
+            for vector in vectors:
+                index.add(vector)
+            index.loaded.add(node_id)
+        return index
+
+    @staticmethod
+    def cached(network_id):
+        """Get the index of a network if it has already been loaded."""
+        return session.info.get('adjacency', {}).get(network_id)
+
+    @staticmethod
+    def discard(network_id):
+        """Forget the index of a network, it will be reloaded on next use."""
+        session.info.get('adjacency', {}).pop(network_id, None)
+
+    def add(self, vector):
+        """Add a vector to the index, unless it is already in it."""
+        if vector in self.known:
+            return
+        self.known.add(vector)
+        self.outgoing[vector.origin_id].append(vector)
+        self.incoming[vector.destination_id].append(vector)
+
+    def remove(self, vector):
+        """Remove a vector from the index."""
+        for vectors in (self.outgoing.get(vector.origin_id, []),
+                        self.incoming.get(vector.destination_id, [])):
+            if vector in vectors:
+                vectors.remove(vector)
+
+    def vectors(self, node_id, direction="all"):
+        """Get the vectors that connect at a node."""
+        vectors = []
+        if direction in ["all", "outgoing"]:
+            vectors.extend(self.outgoing.get(node_id, []))
+        if direction in ["all", "incoming"]:
+            vectors.extend(self.incoming.get(node_id, []))
+        return vectors
+
+    def successors(self, node_id):
+        """The ids of the nodes that a node has vectors to."""
+        return set(v.destination_id for v in self.outgoing.get(node_id, []))
+
+    def predecessors(self, node_id):
+        """The ids of the nodes that a node has vectors from."""
+        return set(v.origin_id for v in self.incoming.get(node_id, []))
+
+
 class SharedMixin(object):
     """Create shared columns."""
 
@@ -69,6 +354,10 @@ class Participant(Base, SharedMixin):
     """An ex silico participant."""
 
     __tablename__ = "participant"
+    __table_args__ = (
+        Index("ix_participant_worker_id", "worker_id"),
+        Index("ix_participant_assignment_id_status", "assignment_id", "status"),
+    )
 
     #: a String giving the name of the class. Defaults to
     #: "participant". This allows subclassing.
@@ -336,6 +625,10 @@ class Network(Base, SharedMixin):
     """Contains and manages a set of Nodes and Vectors etc."""
 
     __tablename__ = "network"
+    __table_args__ = (
+        Index("ix_network_role_full", "role", "full",
+              postgresql_where=NOT_FAILED),
+    )
 
     #: A String giving the name of the class. Defaults to
     #: "network". This allows subclassing.
@@ -353,6 +646,12 @@ class Network(Base, SharedMixin):
     #: Whether the network is currently full
     full = Column(Boolean, nullable=False, default=False, index=True)
 
+    #: The number of not-failed nodes in the network. This is kept up to date
+    #: by :class:`~dallinger.models.Node` as nodes are created and failed, so
+    #: that :func:`~dallinger.models.Network.calculate_full` doesn't need to
+    #: count them.
+    node_count = Column(Integer, nullable=False, default=0)
+
     #: The role of the network. By default dallinger initializes all
     #: networks as either "practice" or "experiment"
     role = Column(String(26), nullable=False, default="default", index=True)
@@ -391,12 +690,16 @@ class Network(Base, SharedMixin):
     Methods that get things about a Network
     ################################### """
 
-    def nodes(self, type=None, failed=False, participant_id=None):
+    def nodes(self, type=None, failed=False, participant_id=None,
+              after_id=None, limit=None, stream=False):
         """Get nodes in the network.
 
         type specifies the type of Node. Failed can be "all", False
         (default) or True. If a participant_id is passed only
         nodes with that participant_id will be returned.
+
+        after_id and limit return a single page of nodes ordered by id,
+        stream returns an iterator that loads the nodes in batches.
         """
         if type is None:
             type = Node
@@ -407,31 +710,14 @@ class Network(Base, SharedMixin):
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid node failed".format(failed))
 
+        query = type.query.filter_by(network_id=self.id)
         if participant_id is not None:
-            if failed == "all":
-                return type\
-                    .query\
-                    .filter_by(network_id=self.id,
-                               participant_id=participant_id)\
-                    .all()
-            else:
-                return type\
-                    .query\
-                    .filter_by(network_id=self.id,
-                               participant_id=participant_id,
-                               failed=failed)\
-                    .all()
-        else:
-            if failed == "all":
-                return type\
-                    .query\
-                    .filter_by(network_id=self.id)\
-                    .all()
-            else:
-                return type\
-                    .query\
-                    .filter_by(failed=failed, network_id=self.id)\
-                    .all()
+            query = query.filter_by(participant_id=participant_id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+
+        return _fetch(query, type,
+                      after_id=after_id, limit=limit, stream=stream)
 
     def size(self, type=None, failed=False):
         """How many nodes in a network.
@@ -439,9 +725,26 @@ class Network(Base, SharedMixin):
         type specifies the class of node, failed
         can be True/False/all.
         """
-        return len(self.nodes(type=type, failed=failed))
+        if type is None:
+            type = Node
 
-    def infos(self, type=None, failed=False):
+        if not issubclass(type, Node):
+            raise(TypeError("{} is not a valid node type.".format(type)))
+
+        if failed not in ["all", False, True]:
+            raise ValueError("{} is not a valid node failed".format(failed))
+
+        if failed == "all":
+            return type.query\
+                .filter_by(network_id=self.id)\
+                .count()
+        else:
+            return type.query\
+                .filter_by(network_id=self.id, failed=failed)\
+                .count()
+
+    def infos(self, type=None, failed=False,
+              after_id=None, limit=None, stream=False):
         """
         Get infos in the network.
 
@@ -450,27 +753,32 @@ class Network(Base, SharedMixin):
         from a specific node, see the infos() method in class
         :class:`~dallinger.models.Node`.
 
+        after_id, limit and stream work as in
+        :func:`~dallinger.models.Network.nodes`.
+
         """
         if type is None:
             type = Info
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid failed".format(failed))
 
-        if failed == "all":
-            return type.query\
-                .filter_by(network_id=self.id)\
-                .all()
-        else:
-            return type.query.filter_by(
-                network_id=self.id, failed=failed).all()
+        query = type.query.filter_by(network_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+
+        return _fetch(query, type,
+                      after_id=after_id, limit=limit, stream=stream)
 
-    def transmissions(self, status="all", failed=False):
+    def transmissions(self, status="all", failed=False,
+                      after_id=None, limit=None, stream=False):
         """Get transmissions in the network.
 
         status { "all", "received", "pending" }
         failed { False, True, "all" }
         To get transmissions from a specific vector, see the
         transmissions() method in class Vector.
+
+        after_id, limit and stream work as in Network.nodes().
         """
         if status not in ["all", "pending", "received"]:
             raise(ValueError("You cannot get transmission of status {}."
@@ -479,27 +787,17 @@ class Network(Base, SharedMixin):
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid failed".format(failed))
 
-        if status == "all":
-            if failed == "all":
-                return Transmission.query\
-                    .filter_by(network_id=self.id)\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter_by(network_id=self.id, failed=failed)\
-                    .all()
-        else:
-            if failed == "all":
-                return Transmission.query\
-                    .filter_by(network_id=self.id, status=status)\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter_by(
-                        network_id=self.id, status=status, failed=failed)\
-                    .all()
+        query = Transmission.query.filter_by(network_id=self.id)
+        if status != "all":
+            query = query.filter_by(status=status)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
 
-    def transformations(self, type=None, failed=False):
+        return _fetch(query, Transmission,
+                      after_id=after_id, limit=limit, stream=stream)
+
+    def transformations(self, type=None, failed=False,
+                        after_id=None, limit=None, stream=False):
         """Get transformations in the network.
 
         type specifies the type of transformation (default = Transformation).
@@ -507,6 +805,8 @@ class Network(Base, SharedMixin):
 
         To get transformations from a specific node,
         see Node.transformations().
+
+        after_id, limit and stream work as in Network.nodes().
         """
         if type is None:
             type = Transformation
@@ -514,14 +814,12 @@ class Network(Base, SharedMixin):
         if failed not in ["all", True, False]:
             raise ValueError("{} is not a valid failed".format(failed))
 
-        if failed == "all":
-            return type.query\
-                .filter_by(network_id=self.id)\
-                .all()
-        else:
-            return type.query\
-                .filter_by(network_id=self.id, failed=failed)\
-                .all()
+        query = type.query.filter_by(network_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+
+        return _fetch(query, type,
+                      after_id=after_id, limit=limit, stream=stream)
 
     def latest_transmission_recipient(self):
         """Get the node that most recently received a transmission."""
@@ -537,24 +835,24 @@ class Network(Base, SharedMixin):
         else:
             return None
 
-    def vectors(self, failed=False):
+    def vectors(self, failed=False, after_id=None, limit=None, stream=False):
         """
         Get vectors in the network.
 
         failed = { False, True, "all" }
         To get the vectors to/from to a specific node, see Node.vectors().
+
+        after_id, limit and stream work as in Network.nodes().
         """
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid vector failed".format(failed))
 
-        if failed == "all":
-            return Vector.query\
-                .filter_by(network_id=self.id)\
-                .all()
-        else:
-            return Vector.query\
-                .filter_by(network_id=self.id, failed=failed)\
-                .all()
+        query = Vector.query.filter_by(network_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+
+        return _fetch(query, Vector,
+                      after_id=after_id, limit=limit, stream=stream)
 
     """ ###################################
     Methods that make Networks do things
@@ -564,8 +862,82 @@ class Network(Base, SharedMixin):
         """Add the node to the network."""
         raise NotImplementedError
 
-    def fail(self):
-        """Fail an entire network."""
+    def lock(self):
+        """Lock the network until the end of the transaction.
+
+        In advisory mode this takes a Postgres advisory lock on the network,
+        waiting for any other transaction that holds it, then refreshes the
+        network so its node count and fullness include that transaction's
+        changes. SERIALIZABLE transactions don't lock, see
+        :func:`~dallinger.db.advisory_lock`.
+        """
+        db.advisory_lock(NETWORK_LOCK_NAMESPACE, self.id)
+        session.refresh(self)
+
+    def connect_many(self, edges):
+        """Create vectors between many pairs of nodes at once.
+
+        edges is an iterable of (origin, destination) pairs of nodes in this
+        network. Each pair is checked as in
+        :func:`~dallinger.models.Node.connect`, and pairs that are already
+        connected are ignored with a warning. Existing connections between
+        the requested pairs are looked up with a single query, and all the
+        new vectors are created with a single INSERT.
+
+        Return a list of the vectors created.
+        """
+        # make sure new nodes have ids before they are referenced
+        session.flush()
+
+        edges = list(edges)
+        pairs = set((origin.id, destination.id)
+                    for origin, destination in edges)
+        successors = defaultdict(set)
+        if pairs:
+            existing = Vector.query\
+                .with_entities(Vector.origin_id, Vector.destination_id)\
+                .filter_by(network_id=self.id, failed=False)\
+                .filter(tuple_(Vector.origin_id,
+                               Vector.destination_id).in_(list(pairs)))
+            for origin_id, destination_id in existing:
+                successors[origin_id].add(destination_id)
+
+        rows = []
+        for origin, destination in edges:
+            if origin.network_id != self.id:
+                raise ValueError("{} cannot connect {} as it is in network {}"
+                                 .format(self, origin, origin.network_id))
+            Vector.check(origin=origin, destination=destination)
+
+            if destination.id in successors[origin.id]:
+                print("Warning! {} already connected to {}, "
+                      "instruction to connect will be ignored."
+                      .format(origin, destination))
+                continue
+            successors[origin.id].add(destination.id)
+
+            rows.append({
+                "creation_time": timenow(),
+                "origin_id": origin.id,
+                "destination_id": destination.id,
+                "network_id": self.id,
+            })
+
+        vectors = _bulk_insert(Vector, rows)
+        index = AdjacencyIndex.cached(self.id)
+        if index is not None:
+            for vector in vectors:
+                index.add(vector)
+        return vectors
+
+    def fail(self, bulk=False):
+        """Fail an entire network.
+
+        If ``bulk`` is True the network's nodes and everything that depends
+        on them are failed with a few set-based UPDATEs instead of calling
+        ``fail()`` on each of them. Note that this bypasses any ``fail()``
+        methods overridden in subclasses.
+        """
         if self.failed is True:
             raise AttributeError(
                 "Cannot fail {} - it has already failed.".format(self))
@@ -573,12 +945,49 @@ class Network(Base, SharedMixin):
             self.failed = True
             self.time_of_death = timenow()
 
-            for n in self.nodes():
-                n.fail()
+            if bulk:
+                node_ids = [n.id for n in Node.query
+                            .with_entities(Node.id)
+                            .filter_by(network_id=self.id, failed=False)
+                            .all()]
+                if node_ids:
+                    _bulk_fail(Node.query.filter(Node.id.in_(node_ids)),
+                               self.time_of_death)
+                _bulk_fail_node_cascade(node_ids, self.time_of_death)
+                AdjacencyIndex.discard(self.id)
+                self._change_node_count(-len(node_ids))
+            else:
+                for n in self.nodes():
+                    n.fail()
+
+    def _change_node_count(self, delta):
+        """Add delta to node_count and update whether the network is full.
+
+        The database does the arithmetic, so that transactions adding or
+        failing nodes in the same network at once don't lose each other's
+        changes.
+        """
+        if self.id is None:
+            # Other transactions can't see a network that isn't flushed yet
+            self.node_count = (self.node_count or 0) + delta
+            self.calculate_full()
+            return
+
+        table = Network.__table__
+        count = session.execute(
+            table.update()
+            .where(table.c.id == self.id)
+            .values(node_count=table.c.node_count + delta)
+            .returning(table.c.node_count)).scalar()
+        set_committed_value(self, 'node_count', count)
+        self.calculate_full()
 
     def calculate_full(self):
         """Set whether the network is full."""
-        self.full = len(self.nodes()) >= self.max_size
+        if self.max_size is None:
+            # The column default is only applied when the network is flushed
+            session.flush()
+        self.full = (self.node_count or 0) >= self.max_size
 
     def print_verbose(self):
         """Print a verbose representation of a network."""
@@ -603,10 +1012,26 @@ class Network(Base, SharedMixin):
             print(t)
 
 
+# Forget the network counts and ids remembered by Experiment.count_networks
+# and Experiment.network_ids when networks are added, changed or deleted
+@event.listens_for(Session, 'after_flush')
+def after_flush(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Network):
+            session.info.pop('networks', None)
+            return
+
+
 class Node(Base, SharedMixin):
     """A point in a network."""
 
     __tablename__ = "node"
+    __table_args__ = (
+        Index("ix_node_network_id_type", "network_id", "type",
+              postgresql_where=NOT_FAILED),
+        Index("ix_node_participant_id_network_id",
+              "participant_id", "network_id"),
+    )
 
     #: A String giving the name of the class. Defaults to
     #: ``node``. This allows subclassing.
@@ -645,7 +1070,7 @@ class Node(Base, SharedMixin):
 
         self.network = network
         self.network_id = network.id
-        network.calculate_full()
+        network._change_node_count(1)
 
         if participant is not None:
             self.participant = participant
@@ -691,6 +1116,11 @@ class Node(Base, SharedMixin):
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid vector failed".format(failed))
 
+        # not-failed vectors are served from the network's adjacency index
+        if failed is False:
+            index = self._adjacency()
+            return index.vectors(self.id, direction=direction)
+
         # get the vectors
         if failed == "all":
             if direction == "all":
@@ -759,34 +1189,23 @@ class Node(Base, SharedMixin):
                 "example, getting not-failed nodes connected to you via failed"
                 " vectors, you should do so via sql queries.")
 
-        neighbors = []
         # get the neighbours
+        index = self._adjacency()
         if direction == "to":
-            outgoing_vectors = Vector.query\
-                .with_entities(Vector.destination_id)\
-                .filter_by(origin_id=self.id, failed=False).all()
-
-            neighbor_ids = [v.destination_id for v in outgoing_vectors]
-            if neighbor_ids:
-                neighbors = Node.query.filter(Node.id.in_(neighbor_ids)).all()
-                neighbors = [n for n in neighbors if isinstance(n, type)]
-
-        if direction == "from":
-            incoming_vectors = Vector.query.with_entities(Vector.origin_id)\
-                .filter_by(destination_id=self.id, failed=False).all()
-
-            neighbor_ids = [v.origin_id for v in incoming_vectors]
-            if neighbor_ids:
-                neighbors = Node.query.filter(Node.id.in_(neighbor_ids)).all()
-                neighbors = [n for n in neighbors if isinstance(n, type)]
-
-        if direction == "either":
-            neighbors = list(set(self.neighbors(type=type, direction="to") +
-                                 self.neighbors(type=type, direction="from")))
+            neighbor_ids = index.successors(self.id)
+        elif direction == "from":
+            neighbor_ids = index.predecessors(self.id)
+        elif direction == "either":
+            neighbor_ids = (index.successors(self.id) |
+                            index.predecessors(self.id))
+        elif direction == "both":
+            neighbor_ids = (index.successors(self.id) &
+                            index.predecessors(self.id))
 
-        if direction == "both":
-            neighbors = list(set(self.neighbors(type=type, direction="to")) &
-                             set(self.neighbors(type=type, direction="from")))
+        neighbors = []
+        if neighbor_ids:
+            neighbors = Node.query.filter(Node.id.in_(neighbor_ids)).all()
+            neighbors = [n for n in neighbors if isinstance(n, type)]
 
         return neighbors
 
@@ -831,52 +1250,41 @@ class Node(Base, SharedMixin):
                              .format(direction))
 
         # get is_connected
-        connected = []
+        index = self._adjacency()
         if direction == "to":
-            vectors = Vector.query.with_entities(Vector.destination_id)\
-                .filter_by(origin_id=self.id, failed=False).all()
-            destinations = set([v.destination_id for v in vectors])
-            for w in whom_ids:
-                connected.append(w in destinations)
-
+            connections = index.successors(self.id)
         elif direction == "from":
-            vectors = Vector.query.with_entities(Vector.origin_id)\
-                .filter_by(destination_id=self.id, failed=False).all()
-            origins = set([v.origin_id for v in vectors])
-            for w in whom_ids:
-                connected.append(w in origins)
+            connections = index.predecessors(self.id)
+        elif direction == "either":
+            connections = (index.successors(self.id) |
+                           index.predecessors(self.id))
+        elif direction == "both":
+            connections = (index.successors(self.id) &
+                           index.predecessors(self.id))
 
-        elif direction in ["either", "both"]:
-
-            vectors = Vector.query\
-                .with_entities(Vector.origin_id, Vector.destination_id)\
-                .filter(and_(Vector.failed == false(),
-                             or_(Vector.destination_id == self.id,
-                                 Vector.origin_id == self.id))).all()
-
-            destinations = set([v.destination_id for v in vectors])
-            origins = set([v.origin_id for v in vectors])
-
-            if direction == "either":
-                origins_destinations = destinations.union(origins)
-
-            elif direction == "both":
-                origins_destinations = destinations.intersection(origins)
-
-            for w in whom_ids:
-                connected.append(w in origins_destinations)
+        connected = [w in connections for w in whom_ids]
 
         if is_list:
             return connected
         else:
             return connected[0]
 
-    def infos(self, type=None, failed=False):
+    def _adjacency(self):
+        """The adjacency index of the network, with this node's vectors."""
+        if self.id is None or self.network_id is None:
+            session.flush()
+        return AdjacencyIndex.for_node(self.network_id, self.id)
+
+    def infos(self, type=None, failed=False,
+              after_id=None, limit=None, stream=False):
         """Get infos that originate from this node.
 
         Type must be a subclass of :class:`~dallinger.models.Info`, the default is
         ``Info``. Failed can be True, False or "all".
 
+        after_id and limit return a single page of infos ordered by id,
+        stream returns an iterator that loads the infos in batches.
+
         """
         if type is None:
             type = Info
@@ -889,21 +1297,25 @@ class Node(Base, SharedMixin):
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid vector failed".format(failed))
 
-        if failed == "all":
-            return type\
-                .query\
-                .filter_by(origin_id=self.id)\
-                .all()
-        else:
-            return type\
-                .query\
-                .filter_by(origin_id=self.id, failed=failed)\
-                .all()
+        query = type.query.filter_by(origin_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
 
-    def received_infos(self, type=None, failed=None):
+        return _fetch(query, type,
+                      after_id=after_id, limit=limit, stream=stream)
+
+    def received_infos(self, type=None, failed=None, since=None,
+                       after_id=None, limit=None, stream=False):
         """Get infos that have been sent to this node.
 
         Type must be a subclass of info, the default is Info.
+        since only returns the infos received after a watermark: if it is a
+        datetime, the infos whose transmission was received after it, if it
+        is a number, the infos whose transmission has a greater
+        ``receive_order``. This is about when the info was received, not
+        created or sent, so an old info that is transmitted later, or a
+        transmission received after one sent later, is still returned.
+        after_id, limit and stream work as in Node.infos().
         """
         if failed is not None:
             raise ValueError(
@@ -924,24 +1336,34 @@ class Node(Base, SharedMixin):
                             "as it is not a valid type."
                             .format(type)))
 
-        transmissions = Transmission\
+        info_ids = Transmission\
             .query.with_entities(Transmission.info_id)\
             .filter_by(destination_id=self.id,
                        status="received",
-                       failed=False).all()
+                       failed=False)
+        if isinstance(since, datetime):
+            info_ids = info_ids.filter(Transmission.receive_time > since)
+        elif since is not None:
+            info_ids = info_ids.filter(Transmission.receive_order > since)
 
-        info_ids = [t.info_id for t in transmissions]
-        if info_ids:
-            return type.query.filter(type.id.in_(info_ids)).all()
-        else:
-            return []
+        query = type.query.filter(type.id.in_(info_ids.subquery()))
+
+        return _fetch(query, type,
+                      after_id=after_id, limit=limit, stream=stream)
 
-    def transmissions(self, direction="outgoing", status="all", failed=False):
+    def transmissions(self, direction="outgoing", status="all", failed=False,
+                      since=None, after_id=None, limit=None, stream=False):
         """Get transmissions sent to or from this node.
 
         Direction can be "all", "incoming" or "outgoing" (default).
         Status can be "all" (default), "pending", or "received".
         failed can be True, False or "all"
+        since can be a datetime or an id, in which case only transmissions
+        created after it, or with a greater id, are returned.
+
+        Transmissions are ordered by creation time. If after_id or limit
+        are given, a single page of transmissions ordered by id is returned
+        instead. stream returns an iterator that loads them in batches.
         """
         # check parameters
         if direction not in ["incoming", "outgoing", "all"]:
@@ -960,54 +1382,29 @@ class Node(Base, SharedMixin):
 
         # get transmissions
         if direction == "all":
-            if status == "all":
-                return Transmission.query\
-                    .filter(and_(Transmission.failed == false(),
-                                 or_(Transmission.destination_id == self.id,
-                                     Transmission.origin_id == self.id)))\
-                    .order_by('creation_time')\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter(and_(Transmission.failed == false(),
-                                 Transmission.status == status,
-                                 or_(Transmission.destination_id == self.id,
-                                     Transmission.origin_id == self.id)))\
-                    .order_by('creation_time')\
-                    .all()
-        if direction == "incoming":
-            if status == "all":
-                return Transmission.query\
-                    .filter_by(failed=False, destination_id=self.id)\
-                    .order_by('creation_time')\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter(and_(Transmission.failed == false(),
-                                 Transmission.destination_id == self.id,
-                                 Transmission.status == status))\
-                    .order_by('creation_time')\
-                    .all()
-        if direction == "outgoing":
-            if status == "all":
-                return Transmission.query\
-                    .filter_by(failed=False, origin_id=self.id)\
-                    .order_by('creation_time')\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter(and_(Transmission.failed == false(),
-                                 Transmission.origin_id == self.id,
-                                 Transmission.status == status))\
-                    .order_by('creation_time')\
-                    .all()
+            query = Transmission.query\
+                .filter(or_(Transmission.destination_id == self.id,
+                            Transmission.origin_id == self.id))
+        elif direction == "incoming":
+            query = Transmission.query.filter_by(destination_id=self.id)
+        else:
+            query = Transmission.query.filter_by(origin_id=self.id)
+
+        query = _since(query.filter_by(failed=False), Transmission, since)
+        if status != "all":
+            query = query.filter_by(status=status)
+
+        return _fetch(query.order_by('creation_time'), Transmission,
+                      after_id=after_id, limit=limit, stream=stream)
 
-    def transformations(self, type=None, failed=False):
+    def transformations(self, type=None, failed=False,
+                        after_id=None, limit=None, stream=False):
         """
         Get Transformations done by this Node.
 
         type must be a type of Transformation (defaults to Transformation)
         Failed can be True, False or "all"
+        after_id, limit and stream work as in Node.infos().
         """
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid transmission failed"
@@ -1016,22 +1413,18 @@ class Node(Base, SharedMixin):
         if type is None:
             type = Transformation
 
-        if failed == "all":
-            return type\
-                .query\
-                .filter_by(node_id=self.id)\
-                .all()
-        else:
-            return type\
-                .query\
-                .filter_by(node_id=self.id, failed=failed)\
-                .all()
+        query = type.query.filter_by(node_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+
+        return _fetch(query, type,
+                      after_id=after_id, limit=limit, stream=stream)
 
     """ ###################################
     Methods that make nodes do things
     ################################### """
 
-    def fail(self):
+    def fail(self, bulk=False):
         """
         Fail a node, setting its status to "failed".
 
@@ -1044,6 +1437,11 @@ class Node(Base, SharedMixin):
         made by this node, transmissions to or from this node and
         transformations made by this node to fail.
 
+        If ``bulk`` is True, the vectors, infos, transmissions and
+        transformations are failed with set-based UPDATEs rather than one
+        ``fail()`` call each, which bypasses any overridden ``fail()``
+        methods.
+
         """
         if self.failed is True:
             raise AttributeError(
@@ -1051,7 +1449,12 @@ class Node(Base, SharedMixin):
         else:
             self.failed = True
             self.time_of_death = timenow()
-            self.network.calculate_full()
+            self.network._change_node_count(-1)
+
+            if bulk:
+                _bulk_fail_node_cascade([self.id], self.time_of_death)
+                AdjacencyIndex.discard(self.network_id)
+                return
 
             for v in self.vectors():
                 v.fail()
@@ -1084,7 +1487,8 @@ class Node(Base, SharedMixin):
         is raised and nothing happens.
 
         This method returns a list of the vectors created
-        (even if there is only one).
+        (even if there is only one). To create many vectors between other
+        nodes at once, see :func:`~dallinger.models.Network.connect_many`.
 
         """
         # check direction
@@ -1095,37 +1499,33 @@ class Node(Base, SharedMixin):
         # make whom a list
         whom = self.flatten([whom])
 
+        # check whom contains only Nodes
+        for node in whom:
+            if not isinstance(node, Node):
+                raise TypeError("{} cannot connect with objects of type {}."
+                                .format(self, type(node)))
+
         # make the connections
-        new_vectors = []
+        edges = []
         if direction in ["to", "both"]:
-            already_connected_to = self.flatten(
-                [self.is_connected(direction="to", whom=whom)])
-            for node, connected in zip(whom, already_connected_to):
-                if connected:
-                    print("Warning! {} already connected to {}, "
-                          "instruction to connect will be ignored."
-                          .format(self, node))
-                else:
-                    new_vectors.append(Vector(origin=self, destination=node))
+            edges.extend((self, node) for node in whom)
         if direction in ["from", "both"]:
-            already_connected_from = self.flatten(
-                [self.is_connected(direction="from", whom=whom)])
-            for node, connected in zip(whom, already_connected_from):
-                if connected:
-                    print("Warning! {} already connected from {}, "
-                          "instruction to connect will be ignored."
-                          .format(self, node))
-                else:
-                    new_vectors.append(Vector(origin=node, destination=self))
-        return new_vectors
+            edges.extend((node, self) for node in whom)
+        return self.network.connect_many(edges)
 
     def flatten(self, l):
         """Turn a list of lists into a list."""
-        if l == []:
-            return l
-        if isinstance(l[0], list):
-            return self.flatten(l[0]) + self.flatten(l[1:])
-        return l[:1] + self.flatten(l[1:])
+        flat = []
+        stack = [iter(l)]
+        while stack:
+            for item in stack[-1]:
+                if isinstance(item, list):
+                    stack.append(iter(item))
+                    break
+                flat.append(item)
+            else:
+                stack.pop()
+        return flat
 
     def transmit(self, what=None, to_whom=None):
         """Transmit one or more infos from one node to another.
@@ -1148,6 +1548,8 @@ class Node(Base, SharedMixin):
                 transmitting node
             (3) to_whom is/contains a node that the transmitting node does not
                 have a not-failed connection with.
+
+        All the transmissions are created with a single INSERT.
         """
         whats = set()
         for what in self.flatten([what]):
@@ -1167,21 +1569,31 @@ class Node(Base, SharedMixin):
             else:
                 to_whoms.add(to_whom)
 
-        transmissions = []
-        vectors = self.vectors(direction="outgoing")
+        # make sure new infos and nodes have ids before they are referenced
+        session.flush()
+
+        vectors = dict((v.destination_id, v)
+                       for v in self.vectors(direction="outgoing"))
+
+        rows = []
         for what in whats:
             for to_whom in to_whoms:
-                try:
-                    vector = [v for v in vectors
-                              if v.destination_id == to_whom.id][0]
-                except IndexError:
+                vector = vectors.get(to_whom.id)
+                if vector is None:
                     raise ValueError(
                         "{} cannot transmit to {} as it does not have "
                         "a connection to them".format(self, to_whom))
-                t = Transmission(info=what, vector=vector)
-                transmissions.append(t)
-
-        return transmissions
+                Transmission.check(vector=vector, info=what)
+                rows.append({
+                    "creation_time": timenow(),
+                    "vector_id": vector.id,
+                    "info_id": what.id,
+                    "origin_id": vector.origin_id,
+                    "destination_id": vector.destination_id,
+                    "network_id": vector.network_id,
+                })
+
+        return _bulk_insert(Transmission, rows)
 
     def _what(self):
         """What to transmit if what is not specified.
@@ -1218,35 +1630,55 @@ class Node(Base, SharedMixin):
         Will raise an error if the node is told to receive a transmission it has
         not been sent.
 
+        Transmissions are marked as received with a single UPDATE, and their
+        infos are loaded with a single query.
+
         """
         # check self is not failed
         if self.failed:
             raise ValueError("{} cannot receive as it has failed."
                              .format(self))
 
-        received_transmissions = []
-        if what is None:
-            pending_transmissions = self.transmissions(direction="incoming",
-                                                       status="pending")
-            for transmission in pending_transmissions:
-                transmission.status = "received"
-                transmission.receive_time = timenow()
-                received_transmissions.append(transmission)
-
-        elif isinstance(what, Transmission):
-            if what in self.transmissions(direction="incoming",
-                                          status="pending"):
-                transmission.status = "received"
-                what.receive_time = timenow()
-                received_transmissions.append(what)
-            else:
-                raise(ValueError("{} cannot receive {} as it is not "
-                                 "in its pending_transmissions"
-                                 .format(self, what)))
-        else:
+        table = Transmission.__table__
+        condition = and_(table.c.destination_id == self.id,
+                         table.c.status == "pending",
+                         table.c.failed == false())
+        if isinstance(what, Transmission):
+            condition = and_(condition, table.c.id == what.id)
+        elif what is not None:
             raise ValueError("Nodes cannot receive {}".format(what))
 
-        self.update([t.info for t in received_transmissions])
+        # make sure pending transmissions are in the database
+        session.flush()
+        rows = session.execute(
+            table.update()
+            .where(condition)
+            .values(status="received", receive_time=timenow(),
+                    receive_order=RECEIVE_ORDER.next_value())
+            .returning(table.c.id, table.c.info_id, table.c.creation_time)
+        ).fetchall()
+
+        if what is not None and not rows:
+            raise(ValueError("{} cannot receive {} as it is not "
+                             "in its pending_transmissions"
+                             .format(self, what)))
+
+        # loaded transmissions no longer reflect the database
+        for row in rows:
+            transmission = session.identity_map.get(
+                identity_key(Transmission, row.id))
+            if transmission is not None:
+                session.expire(transmission,
+                               ["status", "receive_time", "receive_order"])
+
+        rows.sort(key=lambda row: (row.creation_time, row.id))
+        info_ids = set(row.info_id for row in rows)
+        infos = {}
+        if info_ids:
+            infos = dict((i.id, i) for i in
+                         Info.query.filter(Info.id.in_(info_ids)))
+
+        self.update([infos[row.info_id] for row in rows])
 
     def update(self, infos):
         """Process received infos.
@@ -1293,6 +1725,12 @@ class Vector(Base, SharedMixin):
     """
 
     __tablename__ = "vector"
+    __table_args__ = (
+        Index("ix_vector_origin_id_destination_id",
+              "origin_id", "destination_id", postgresql_where=NOT_FAILED),
+        Index("ix_vector_destination_id_origin_id",
+              "destination_id", "origin_id", postgresql_where=NOT_FAILED),
+    )
 
     #: the id of the Node at which the vector originates
     origin_id = Column(Integer, ForeignKey('node.id'), index=True)
@@ -1316,6 +1754,25 @@ class Vector(Base, SharedMixin):
 
     def __init__(self, origin, destination):
         """Create a vector."""
+        self.check(origin=origin, destination=destination)
+
+        self.origin = origin
+        self.origin_id = origin.id
+        self.destination = destination
+        self.destination_id = destination.id
+        self.network = origin.network
+        self.network_id = origin.network_id
+
+        index = AdjacencyIndex.cached(self.network_id)
+        if index is not None:
+            if self.origin_id is None or self.destination_id is None:
+                AdjacencyIndex.discard(self.network_id)
+            else:
+                index.add(self)
+
+    @staticmethod
+    def check(origin, destination):
+        """Raise an error if origin cannot connect to destination."""
         # check origin and destination are in the same network
         if origin.network_id != destination.network_id:
             raise ValueError("{}, in network {}, cannot connect with {} "
@@ -1341,13 +1798,6 @@ class Vector(Base, SharedMixin):
         if origin == destination:
             raise ValueError("{} cannot connect to itself.".format(origin))
 
-        self.origin = origin
-        self.origin_id = origin.id
-        self.destination = destination
-        self.destination_id = destination.id
-        self.network = origin.network
-        self.network_id = origin.network_id
-
     def __repr__(self):
         """The string representation of a vector."""
         return "Vector-{}-{}".format(
@@ -1411,6 +1861,10 @@ class Vector(Base, SharedMixin):
             self.failed = True
             self.time_of_death = timenow()
 
+            index = AdjacencyIndex.cached(self.network_id)
+            if index is not None:
+                index.remove(self)
+
             for t in self.transmissions():
                 t.fail()
 
@@ -1419,6 +1873,10 @@ class Info(Base, SharedMixin):
     """A unit of information."""
 
     __tablename__ = "info"
+    __table_args__ = (
+        Index("ix_info_origin_id_type", "origin_id", "type",
+              postgresql_where=NOT_FAILED),
+    )
 
     #: a String giving the name of the class. Defaults to "info".
     #: This allows subclassing.
@@ -1584,6 +2042,12 @@ class Transmission(Base, SharedMixin):
     """An instance of an Info being sent along a Vector."""
 
     __tablename__ = "transmission"
+    __table_args__ = (
+        Index("ix_transmission_destination_id_status",
+              "destination_id", "status", postgresql_where=NOT_FAILED),
+        Index("ix_transmission_origin_id_status",
+              "origin_id", "status", postgresql_where=NOT_FAILED),
+    )
 
     #: the id of the vector the info was sent along
     vector_id = Column(Integer, ForeignKey('vector.id'), index=True)
@@ -1620,6 +2084,10 @@ class Transmission(Base, SharedMixin):
     #: the time at which the transmission was received
     receive_time = Column(DateTime, default=None)
 
+    #: the position of the transmission in the order transmissions were
+    #: received in, see :data:`RECEIVE_ORDER`
+    receive_order = Column(BigInteger, default=None)
+
     #: the status of the transmission, can be "pending", which means the
     #: transmission has been sent, but not received; or "received", which means
     #: the transmission has been sent and received
@@ -1628,6 +2096,22 @@ class Transmission(Base, SharedMixin):
 
     def __init__(self, vector, info):
         """Create a transmission."""
+        self.check(vector=vector, info=info)
+
+        self.vector_id = vector.id
+        self.vector = vector
+        self.info_id = info
+        self.info = info
+        self.origin_id = vector.origin_id
+        self.origin = vector.origin
+        self.destination_id = vector.destination_id
+        self.destination = vector.destination
+        self.network_id = vector.network_id
+        self.network = vector.network
+
+    @staticmethod
+    def check(vector, info):
+        """Raise an error if info cannot be transmitted along vector."""
         # check vector is not failed
         if vector.failed:
             raise ValueError("Cannot transmit along {} as it has failed."
@@ -1643,20 +2127,10 @@ class Transmission(Base, SharedMixin):
             raise ValueError("Cannot transmit {} along {} as they do not "
                              "have the same origin".format(info, vector))
 
-        self.vector_id = vector.id
-        self.vector = vector
-        self.info_id = info
-        self.info = info
-        self.origin_id = vector.origin_id
-        self.origin = vector.origin
-        self.destination_id = vector.destination_id
-        self.destination = vector.destination
-        self.network_id = vector.network_id
-        self.network = vector.network
-
     def mark_received(self):
         """Mark a transmission as having been received."""
         self.receive_time = timenow()
+        self.receive_order = RECEIVE_ORDER.next_value()
         self.status = "received"
 
     def __repr__(self):
@@ -1674,6 +2148,7 @@ class Transmission(Base, SharedMixin):
             "network_id": self.network_id,
             "creation_time": self.creation_time,
             "receive_time": self.receive_time,
+            "receive_order": self.receive_order,
             "failed": self.failed,
             "time_of_death": self.time_of_death,
             "status": self.status,
@@ -1698,6 +2173,10 @@ class Transformation(Base, SharedMixin):
     """An instance of one info being transformed into another."""
 
     __tablename__ = "transformation"
+    __table_args__ = (
+        Index("ix_transformation_node_id_not_failed", "node_id",
+              postgresql_where=NOT_FAILED),
+    )
 
     #: a String giving the name of the class. Defaults to
     #: "transformation". This allows subclassing.
@@ -1,10 +1,19 @@
 """Network structures commonly used in simulations of evolution."""
 
 from operator import attrgetter
-import random
+
+from sqlalchemy import and_
+from sqlalchemy import exists
+from sqlalchemy import false
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased
 
 from .models import Network
+from .models import Node
+from .models import Vector
 from .nodes import Source
+from .sampling import weighted_sample
 
 
 class DelayedChain(Network):
@@ -55,13 +64,15 @@ class FullyConnected(Network):
 
     def add_node(self, node):
         """Add a node, connecting it to everyone and back."""
-        other_nodes = [n for n in self.nodes() if n.id != node.id]
+        edges = []
+        for n in self.nodes():
+            if n.id == node.id:
+                continue
+            edges.append((n, node))
+            if not isinstance(n, Source):
+                edges.append((node, n))
 
-        for n in other_nodes:
-            if isinstance(n, Source):
-                node.connect(direction="from", whom=n)
-            else:
-                node.connect(direction="both", whom=n)
+        self.connect_many(edges)
 
 
 class Empty(Network):
@@ -184,20 +195,19 @@ class DiscreteGenerational(Network):
         return min(self.nodes(type=Source), key=attrgetter('creation_time'))
 
     def _select_fit_node_from_generation(self, node_type, generation):
+        # Only the ids and fitnesses are loaded, then the chosen node
         prev_agents = node_type.query\
             .filter_by(failed=False,
                        network_id=self.id,
                        generation=(generation))\
+            .with_entities(node_type.id, node_type.fitness)\
             .all()
-        prev_fits = [p.fitness for p in prev_agents]
-        prev_probs = [(f / (1.0 * sum(prev_fits))) for f in prev_fits]
+        if not prev_agents:
+            return None
 
-        rnd = random.random()
-        temp = 0.0
-        for i, probability in enumerate(prev_probs):
-            temp += probability
-            if temp > rnd:
-                return prev_agents[i]
+        ids = [agent.id for agent in prev_agents]
+        fitnesses = [agent.fitness for agent in prev_agents]
+        return node_type.query.get(weighted_sample(ids, fitnesses))
 
 
 class ScaleFree(Network):
@@ -228,38 +238,56 @@ class ScaleFree(Network):
         return int(self.property2)
 
     def add_node(self, node):
-        """Add newcomers one by one, using linear preferential attachment."""
-        nodes = self.nodes()
+        """Add newcomers one by one, using linear preferential attachment.
 
+        The outdegrees of the members the newcomer isn't connected to yet are
+        counted with a single aggregate query, and only the m chosen members
+        are loaded.
+        """
         # Start with a core of m0 fully-connected agents...
-        if len(nodes) <= self.m0:
-            other_nodes = [n for n in nodes if n.id != node.id]
+        if self.size() <= self.m0:
+            other_nodes = [n for n in self.nodes() if n.id != node.id]
             for n in other_nodes:
                 node.connect(direction="both", whom=n)
 
         # ...then add newcomers one by one with preferential attachment.
         else:
+            # Members without outgoing vectors can't be chosen, so they are
+            # left out
+            own = aliased(Vector)
+            connected = exists().where(and_(
+                own.failed == false(),
+                or_(and_(own.origin_id == node.id,
+                         own.destination_id == Vector.origin_id),
+                    and_(own.destination_id == node.id,
+                         own.origin_id == Vector.origin_id))))
+            degrees = Vector.query\
+                .with_entities(Vector.origin_id, func.count(Vector.id))\
+                .filter_by(network_id=self.id, failed=False)\
+                .filter(Vector.origin_id != node.id)\
+                .filter(~connected)\
+                .group_by(Vector.origin_id)\
+                .order_by(Vector.origin_id)\
+                .all()
+            member_ids = [member_id for member_id, _ in degrees]
+            weights = [degree for _, degree in degrees]
+
+            # Select members using preferential attachment
+            chosen_ids = []
             for idx_newvector in xrange(self.m):
-
-                these_nodes = [
-                    n for n in nodes if (
-                        n.id != node.id and
-                        not n.is_connected(direction="either", whom=node))]
-
-                outdegrees = [
-                    len(n.vectors(direction="outgoing")) for n in these_nodes]
-
-                # Select a member using preferential attachment
-                ps = [(d / (1.0 * sum(outdegrees))) for d in outdegrees]
-                rnd = random.random() * sum(ps)
-                cur = 0.0
-                for i, p in enumerate(ps):
-                    cur += p
-                    if rnd < cur:
-                        vector_to = these_nodes[i]
-
-                # Create vector from newcomer to selected member and back
-                node.connect(direction="both", whom=vector_to)
+                if not any(weights):
+                    break
+                i = weighted_sample(range(len(weights)), weights)
+                chosen_ids.append(member_ids[i])
+                # Each member is connected to at most once
+                weights[i] = 0
+
+            if chosen_ids:
+                members = dict((n.id, n) for n in Node.query.filter(
+                    Node.id.in_(chosen_ids)))
+                # Create vectors from newcomer to selected members and back
+                node.connect(direction="both",
+                             whom=[members[i] for i in chosen_ids])
 
 
 class SequentialMicrosociety(Network):
@@ -0,0 +1,62 @@
+"""Random sampling of items in proportion to their weights."""
+
+from bisect import bisect_right
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def weighted_sample(items, weights, k=None):
+    """Draw items with probability proportional to their weights.
+
+    Returns one item, or a list of k items drawn with replacement. The
+    cumulative weights are computed once for all the draws, with NumPy if it
+    is installed.
+    """
+    if len(items) != len(weights):
+        raise ValueError("Got {} items but {} weights."
+                         .format(len(items), len(weights)))
+    if any(weight is None for weight in weights):
+        # NumPy would turn None into NaN and draw from the wrong items
+        raise ValueError("Weights cannot be None.")
+    if numpy is not None:
+        indices = _sample_indices_numpy(weights, 1 if k is None else k)
+    else:
+        indices = _sample_indices(weights, 1 if k is None else k)
+
+    if k is None:
+        return items[indices[0]]
+    return [items[i] for i in indices]
+
+
+def _sample_indices_numpy(weights, k):
+    weights = numpy.asarray(weights, dtype=float)
+    if numpy.any(weights < 0):
+        raise ValueError("Weights cannot be negative.")
+    cumulative = numpy.cumsum(weights)
+    if not len(cumulative) or cumulative[-1] <= 0:
+        raise ValueError("Cannot sample when all weights are zero.")
+    draws = numpy.random.random(k) * cumulative[-1]
+    indices = numpy.searchsorted(cumulative, draws, side="right")
+    # Round-off can put a draw at the total, past the last positive weight
+    last = numpy.flatnonzero(weights)[-1]
+    return numpy.minimum(indices, last).tolist()
+
+
+def _sample_indices(weights, k):
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        if weight < 0:
+            raise ValueError("Weights cannot be negative.")
+        total += weight
+        cumulative.append(total)
+    if total <= 0:
+        raise ValueError("Cannot sample when all weights are zero.")
+    # Round-off can put a draw at the total, past the last positive weight
+    last = max(i for i, weight in enumerate(weights) if weight > 0)
+    return [min(bisect_right(cumulative, random.random() * total), last)
+            for _ in range(k)]
@@ -44,7 +44,7 @@ class Bartlett1932(Experiment):
         function in the super (see experiments.py in dallinger). Then it adds a
         source to each network.
         """
-        if not self.networks():
+        if not self.count_networks():
             super(Bartlett1932, self).setup()
             for net in self.networks():
                 self.models.WarOfTheGhostsSource(network=net)
@@ -64,7 +64,7 @@ class Bartlett1932(Experiment):
 
     def recruit(self):
         """Recruit one participant at a time until all networks are full."""
-        if self.networks(full=False):
+        if self.count_networks(full=False):
             self.recruiter().recruit(n=1)
 
         else:
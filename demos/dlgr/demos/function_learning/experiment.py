@@ -31,7 +31,7 @@ class FunctionLearning(Experiment):
         calls the same function in the super (see experiments.py in dallinger).
         Then it adds a source to each network.
         """
-        if not self.networks():
+        if not self.count_networks():
             super(FunctionLearning, self).setup()
             for net in self.networks():
                 self.models.SinusoidalFunctionSource(network=net)
@@ -49,7 +49,7 @@ class FunctionLearning(Experiment):
 
     def recruit(self):
         """Recruit one participant at a time until all networks are full."""
-        if self.networks(full=False):
+        if self.count_networks(full=False):
             self.recruiter().recruit(n=1)
         else:
             self.recruiter().close_recruitment()
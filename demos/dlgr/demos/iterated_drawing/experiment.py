@@ -32,7 +32,7 @@ class IteratedDrawing(Experiment):
         function in the super (see experiments.py in dallinger). Then it adds a
         source to each network.
         """
-        if not self.networks():
+        if not self.count_networks():
             super(IteratedDrawing, self).setup()
             for net in self.networks():
                 self.models.DrawingSource(network=net)
@@ -50,7 +50,7 @@ class IteratedDrawing(Experiment):
 
     def recruit(self):
         """Recruit one participant at a time until all networks are full."""
-        if self.networks(full=False):
+        if self.count_networks(full=False):
             self.recruiter().recruit(n=1)
         else:
             self.recruiter().close_recruitment()
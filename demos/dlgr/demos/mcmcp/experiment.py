@@ -42,7 +42,7 @@ class MCMCP(Experiment):
 
     def setup(self):
         """Setup the networks."""
-        if not self.networks():
+        if not self.count_networks():
             super(MCMCP, self).setup()
             for net in self.networks():
                 self.models.AnimalSource(network=net)
@@ -53,7 +53,9 @@ class MCMCP(Experiment):
 
     def get_network_for_participant(self, participant):
         if len(participant.nodes(failed="all")) < self.trials_per_participant:
-            return random.choice(self.networks())
+            network = random.choice(self.networks())
+            network.lock()
+            return network
         else:
             return None
 
@@ -42,7 +42,7 @@ class RogersExperiment(Experiment):
         self.initial_recruitment_size = self.generation_size
         self.known_classes["LearningGene"] = self.models.LearningGene
 
-        if session and not self.networks():
+        if session and not self.count_networks():
             self.setup()
         self.save()
 
@@ -61,6 +61,9 @@ class RogersExperiment(Experiment):
                                  self.catch_repeats):
             net.role = "catch"
 
+        experiment_networks = self.network_ids(role="experiment")
+        positions = dict((id, i) for i, id in enumerate(experiment_networks))
+
         for net in self.networks():
             source = self.models.RogersSource(network=net)
             source.create_information()
@@ -71,8 +74,7 @@ class RogersExperiment(Experiment):
                 env = self.models.RogersEnvironment(network=net)
                 env.create_state(proportion=self.catch_difficulty)
             if net.role == "experiment":
-                difficulty = self.difficulties[self.networks(role="experiment")
-                                               .index(net)]
+                difficulty = self.difficulties[positions[net.id]]
                 env = self.models.RogersEnvironment(network=net)
                 env.create_state(proportion=difficulty)
 
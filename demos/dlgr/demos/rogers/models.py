@@ -7,6 +7,7 @@ from sqlalchemy.sql.expression import cast
 
 from dallinger import transformations
 from dallinger.information import Gene, Meme, State
+from dallinger.models import hybrid_property_index
 from dallinger.nodes import Agent, Environment, Source
 
 
@@ -146,6 +147,11 @@ class RogersAgentFounder(RogersAgent):
                 self.replicate(info)
 
 
+# DiscreteGenerational selects parents by network and generation. This has to
+# come after RogersAgentFounder so that the index covers both agent types.
+hybrid_property_index(RogersAgent, "network_id", "generation")
+
+
 class RogersEnvironment(Environment):
     """The Rogers environment."""
 
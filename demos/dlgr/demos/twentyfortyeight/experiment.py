@@ -22,5 +22,5 @@ class TwentyFortyEight(dallinger.experiment.Experiment):
 
     def recruit(self):
         """Recruitment."""
-        if not self.networks(full=False):
+        if not self.count_networks(full=False):
             self.recruiter().close_recruitment()
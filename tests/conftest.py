@@ -203,3 +203,5 @@ def pytest_addoption(parser):
                      help="Run comprehensive MTurk integration tests during test run")
     parser.addoption("--heroku", action="store_true",
                      help="Run tests requiring heroku login")
+    parser.addoption("--benchmarks", action="store_true",
+                     help="Run database and server benchmarks during test run")
@@ -0,0 +1,246 @@
+"""Benchmarks for Dallinger's hot database and server paths.
+
+These build tables at a realistic scale and take a while, so they only run
+when pytest is given ``--benchmarks``.
+"""
+
+from __future__ import print_function
+import mock
+import threading
+import pytest
+
+from dallinger import db
+from dallinger import models
+from dallinger.nodes import Agent
+
+ROWS = 100000
+
+POPULATE = [
+    """INSERT INTO network (creation_time, failed, type, max_size, "full",
+                           role, node_count)
+       SELECT now(), false, 'network', 1000, false, 'experiment', 0
+       FROM generate_series(1, 100)""",
+    """INSERT INTO participant (creation_time, failed, type, worker_id,
+                               assignment_id, unique_id, hit_id, mode, status)
+       SELECT now(), false, 'participant', 'w' || i, 'a' || i,
+              'w' || i || ':a' || i, 'h', 'debug',
+              (CASE WHEN i % 20 = 0 THEN 'working'
+                    ELSE 'approved' END)::participant_status
+       FROM generate_series(1, :rows) AS i""",
+    """INSERT INTO node (creation_time, failed, type, network_id,
+                        participant_id)
+       SELECT now(), i % 10 = 0,
+              CASE WHEN i % 2 = 0 THEN 'agent' ELSE 'node' END,
+              1 + i % 100, i
+       FROM generate_series(1, :rows) AS i""",
+    """INSERT INTO vector (creation_time, failed, origin_id, destination_id,
+                          network_id)
+       SELECT now(), i % 10 = 0, i, 1 + (i * 7919) % :rows, 1 + i % 100
+       FROM generate_series(1, :rows) AS i""",
+    """INSERT INTO info (creation_time, failed, type, origin_id, network_id,
+                        contents)
+       SELECT now(), i % 10 = 0, 'info', i, 1 + i % 100, 'contents'
+       FROM generate_series(1, :rows) AS i""",
+    """INSERT INTO transmission (creation_time, failed, vector_id, info_id,
+                                origin_id, destination_id, network_id, status)
+       SELECT now(), i % 10 = 0, i, i, i, 1 + (i * 7919) % :rows, 1 + i % 100,
+              (CASE WHEN i % 3 = 0 THEN 'pending'
+                    ELSE 'received' END)::transmission_status
+       FROM generate_series(1, :rows) AS i""",
+]
+
+COMPOSITE_INDEXES = [
+    index.name
+    for table in models.Base.metadata.sorted_tables
+    for index in table.indexes
+    if len(index.expressions) > 1 or index.dialect_options['postgresql']['where'] is not None
+]
+
+
+def explain(session, query):
+    statement = query.statement.compile(
+        dialect=session.bind.dialect,
+        compile_kwargs={'literal_binds': True})
+    rows = session.execute('EXPLAIN {}'.format(statement)).fetchall()
+    return '\n'.join(row[0] for row in rows)
+
+
+@pytest.mark.skipif(not pytest.config.getvalue("benchmarks"),
+                    reason="--benchmarks was not specified")
+class TestQueryPlans(object):
+
+    @pytest.fixture
+    def populated(self, db_session):
+        for statement in POPULATE:
+            db_session.execute(statement, {'rows': ROWS})
+        db_session.commit()
+        db_session.execute('ANALYZE')
+        return db_session
+
+    def compare(self, session, query, indexes=COMPOSITE_INDEXES):
+        with_indexes = explain(session, query)
+
+        session.begin_nested()
+        for name in indexes:
+            session.execute('DROP INDEX {}'.format(name))
+        without_indexes = explain(session, query)
+        session.rollback()
+
+        print('\n{}\n-- with indexes:\n{}\n-- without:\n{}'.format(
+            query.statement, with_indexes, without_indexes))
+        return with_indexes, without_indexes
+
+    def test_pending_transmissions(self, populated):
+        query = models.Transmission.query.filter_by(
+            destination_id=500, status="pending", failed=False)
+        plan, _ = self.compare(populated, query)
+        assert 'ix_transmission_destination_id_status' in plan
+
+    def test_outgoing_vectors(self, populated):
+        query = models.Vector.query.filter_by(origin_id=500, failed=False)
+        plan, _ = self.compare(populated, query)
+        assert 'ix_vector_origin_id_destination_id' in plan
+
+    def test_incoming_vectors(self, populated):
+        query = models.Vector.query.filter_by(destination_id=500, failed=False)
+        plan, _ = self.compare(populated, query)
+        assert 'ix_vector_destination_id_origin_id' in plan
+
+    def test_network_nodes_of_type(self, populated):
+        query = Agent.query.filter_by(network_id=5, failed=False)
+        self.compare(populated, query)
+
+    def test_node_infos(self, populated):
+        query = models.Info.query.filter_by(origin_id=500, failed=False)
+        self.compare(populated, query)
+
+    def test_participant_by_worker(self, populated):
+        query = models.Participant.query.filter_by(worker_id='w500')
+        # ix_participant_worker_id is a single-column index, so it isn't
+        # one of the COMPOSITE_INDEXES dropped by default
+        plan, without = self.compare(
+            populated, query,
+            indexes=COMPOSITE_INDEXES + ['ix_participant_worker_id'])
+        assert 'ix_participant_worker_id' in plan
+        assert 'Seq Scan' in without
+
+    def test_participant_by_assignment_and_status(self, populated):
+        query = models.Participant.query.filter_by(
+            assignment_id='a500', status='working')
+        self.compare(populated, query)
+
+
+@pytest.mark.skipif(not pytest.config.getvalue("benchmarks"),
+                    reason="--benchmarks was not specified")
+class TestConcurrentJoins(object):
+    """Many participants asking for a node at once, as in a chatroom quorum."""
+
+    PARTICIPANTS = 50
+    NETWORKS = 5
+
+    @pytest.fixture
+    def experiment(self, db_session):
+        from dallinger.experiment import Experiment
+        from dallinger.networks import Empty
+
+        networks = [Empty(max_size=self.PARTICIPANTS // self.NETWORKS)
+                    for _ in range(self.NETWORKS)]
+        participants = [
+            models.Participant(worker_id=str(i), assignment_id=str(i),
+                               hit_id='h', mode='debug')
+            for i in range(self.PARTICIPANTS)
+        ]
+        db_session.add_all(networks + participants)
+        db_session.commit()
+
+        exp = Experiment(db.session)
+        exp.verbose = False
+        return exp
+
+    def join(self, experiment, mode):
+        attempts = []
+
+        def create_node(participant_id):
+            attempts.append(participant_id)
+            participant = models.Participant.query.get(participant_id)
+            network = experiment.get_network_for_participant(participant)
+            node = experiment.create_node(participant, network)
+            experiment.add_node_to_network(node, network)
+
+        create_node = {
+            'serializable': db.serialized,
+            'advisory': db.advisory_locked,
+        }[mode](create_node)
+
+        ids = [p.id for p in models.Participant.query]
+        db.session.remove()
+        threads = [threading.Thread(target=create_node, args=(i, ))
+                   for i in ids]
+        # Networks are only locked in advisory mode
+        with mock.patch('dallinger.db.config_value') as config_value:
+            config_value.side_effect = lambda key, default: (
+                mode if key == 'database_concurrency' else default)
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        retries = len(attempts) - len(ids)
+        print('\n{}: {} joins, {} retries'.format(mode, len(ids), retries))
+
+        sizes = [n.size() for n in models.Network.query]
+        assert sum(sizes) == len(ids)
+        assert max(sizes) == self.PARTICIPANTS // self.NETWORKS
+        return retries
+
+    def test_serializable(self, experiment):
+        self.join(experiment, 'serializable')
+
+    def test_advisory(self, experiment):
+        assert self.join(experiment, 'advisory') == 0
+
+
+@pytest.mark.skipif(not pytest.config.getvalue("benchmarks"),
+                    reason="--benchmarks was not specified")
+@pytest.mark.usefixtures("experiment_dir")
+class TestChatFanOut(object):
+    """Relaying chat messages to everyone in a large chatroom."""
+
+    CLIENTS = 100
+    MESSAGES = 1000
+
+    def test_messages_per_second(self):
+        import gevent
+        import time
+        from mock import Mock
+        from dallinger.experiment_server.sockets import ChatBackend
+
+        class Client(object):
+            sent = 0
+
+            def send(self, data):
+                self.sent += 1
+
+        def listen():
+            for i in range(self.MESSAGES):
+                gevent.sleep(0)  # reading from redis yields to other greenlets
+                yield {'type': 'message', 'channel': 'chat',
+                       'data': 'message {}'.format(i)}
+
+        chat = ChatBackend()
+        chat.pubsub = Mock()
+        chat.pubsub.channels = {'chat'}
+        chat.pubsub.listen = listen
+        chat.greenlet = Mock()
+        clients = [Client() for _ in range(self.CLIENTS)]
+        for client in clients:
+            chat.subscribe(client, 'chat')
+
+        start = time.time()
+        chat.run()
+        gevent.wait()
+        elapsed = time.time() - start
+
+        print('\n{} messages to {} clients: {:.0f} messages per second'.format(
+            self.MESSAGES, self.CLIENTS, self.MESSAGES / elapsed))
+        assert sum(client.sent for client in clients) == self.MESSAGES * self.CLIENTS
@@ -1,4 +1,5 @@
 import mock
+import pytest
 
 
 def test_serialized(db_session):
@@ -42,6 +43,55 @@ def test_serialized(db_session):
     assert counts == [0, 0, 1]
 
 
+def test_serialized_gives_up_after_max_attempts(db_session):
+    from psycopg2.extensions import TransactionRollbackError
+    from sqlalchemy.exc import OperationalError
+    from dallinger import db
+
+    attempts = []
+
+    def conflict():
+        attempts.append(1)
+        raise OperationalError('', {}, TransactionRollbackError())
+    conflict = db.serialized(conflict)
+
+    settings = {'serialized_max_attempts': 3, 'serialized_backoff': 0.5}
+    with mock.patch('dallinger.db.config_value') as config_value, \
+            mock.patch('dallinger.db.gevent.sleep') as sleep:
+        config_value.side_effect = lambda key, default: settings.get(key, default)
+        retries = db.serialized_retries['conflict']
+        aborts = db.serialized_aborts['conflict']
+
+        with pytest.raises(Exception):
+            conflict()
+
+    assert len(attempts) == 3
+    assert db.serialized_retries['conflict'] == retries + 2
+    assert db.serialized_aborts['conflict'] == aborts + 1
+    # The backoff doubles with every attempt
+    delays = [call[0][0] for call in sleep.call_args_list]
+    assert len(delays) == 2
+    assert 0 <= delays[0] <= 0.5
+    assert 0 <= delays[1] <= 1.0
+
+
+def test_engine_pool_follows_config():
+    from sqlalchemy.pool import NullPool
+    from dallinger import db
+
+    settings = {'database_pool_size': 3, 'database_pool_overflow': 2}
+    with mock.patch('dallinger.db.config_value') as config_value:
+        config_value.side_effect = lambda key, default: settings.get(key, default)
+        engine = db.create_db_engine()
+        assert engine.pool.size() == 3
+        assert db.pool_budget() == 5
+
+        settings['database_pool'] = 'null'
+        engine = db.create_db_engine()
+        assert isinstance(engine.pool, NullPool)
+        assert db.pool_budget() is None
+
+
 def test_after_commit_hook(db_session):
     with mock.patch('dallinger.heroku.worker.conn') as redis:
         from dallinger.db import queue_message
@@ -49,3 +99,110 @@ def test_after_commit_hook(db_session):
         db_session.commit()
 
         assert redis.called_once_with('test', 'test')
+
+
+def test_advisory_lock(db_session):
+    from dallinger.db import advisory_lock
+
+    with mock.patch('dallinger.db.config_value') as config_value:
+        config_value.return_value = 'advisory'
+        advisory_lock(1, 42)
+
+    session2 = db_session.session_factory()
+    try_lock = "SELECT pg_try_advisory_xact_lock(:namespace, :key)"
+    assert not session2.execute(try_lock, {'namespace': 1, 'key': 42}).scalar()
+    assert session2.execute(try_lock, {'namespace': 2, 'key': 42}).scalar()
+    session2.rollback()
+
+    # The lock is released at the end of the transaction
+    db_session.commit()
+    assert session2.execute(try_lock, {'namespace': 1, 'key': 42}).scalar()
+    session2.close()
+
+
+def test_advisory_lock_is_skipped_when_serializable(db_session):
+    from dallinger.db import advisory_lock
+
+    with mock.patch('dallinger.db.config_value') as config_value:
+        config_value.return_value = 'serializable'
+        advisory_lock(1, 42)
+
+    session2 = db_session.session_factory()
+    try_lock = "SELECT pg_try_advisory_xact_lock(:namespace, :key)"
+    assert session2.execute(try_lock, {'namespace': 1, 'key': 42}).scalar()
+    session2.rollback()
+    session2.close()
+
+
+def test_exclusive_uses_configured_mode(db_session):
+    from dallinger.db import exclusive
+
+    def isolation_level():
+        return db_session.execute('SHOW transaction_isolation').scalar()
+    exclusive_isolation_level = exclusive(isolation_level)
+
+    with mock.patch('dallinger.db.config_value') as config_value:
+        config_value.return_value = 'serializable'
+        assert exclusive_isolation_level() == 'serializable'
+
+        config_value.return_value = 'advisory'
+        assert exclusive_isolation_level() == 'read committed'
+
+
+def test_exclusive_rejects_unknown_mode(db_session):
+    from dallinger.db import exclusive
+
+    with mock.patch('dallinger.db.config_value') as config_value:
+        config_value.return_value = 'optimistic'
+        with pytest.raises(ValueError) as excinfo:
+            exclusive(lambda: None)()
+        assert 'Unknown database_concurrency "optimistic"' in str(excinfo.value)
+
+
+def test_after_commit_publishes_in_one_round_trip(db_session):
+    with mock.patch('dallinger.heroku.worker.conn') as redis:
+        from dallinger.db import queue_message
+        queue_message('a', '1')
+        queue_message('b', '2')
+        db_session.commit()
+
+        pipeline = redis.pipeline.return_value
+        assert pipeline.publish.call_args_list == [
+            mock.call('a', '1'), mock.call('b', '2')]
+        pipeline.execute.assert_called_once_with()
+        assert not redis.publish.called
+
+
+def test_publish_in_background_keeps_order(db_session):
+    import gevent
+    from dallinger import db
+
+    with mock.patch('dallinger.heroku.worker.conn') as redis, \
+            mock.patch('dallinger.db.config_value') as config_value, \
+            mock.patch('dallinger.db.monkey.is_module_patched') as patched:
+        config_value.side_effect = lambda key, default: (
+            True if key == 'publish_in_background' else default)
+        patched.return_value = True
+        db.queue_message('a', '1')
+        db_session.commit()
+        db.queue_message('a', '2')
+        db_session.commit()
+
+        pipeline = redis.pipeline.return_value
+        assert not pipeline.publish.called
+        gevent.sleep(0)
+        assert pipeline.publish.call_args_list == [
+            mock.call('a', '1'), mock.call('a', '2')]
+
+
+def test_publish_in_background_without_gevent(db_session):
+    from dallinger import db
+
+    with mock.patch('dallinger.heroku.worker.conn') as redis, \
+            mock.patch('dallinger.db.monkey.is_module_patched') as patched:
+        patched.return_value = False
+        db.publish_in_background([('a', '1')])
+
+        # Nothing would switch to a publisher greenlet, so it isn't used
+        pipeline = redis.pipeline.return_value
+        pipeline.publish.assert_called_once_with('a', '1')
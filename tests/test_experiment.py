@@ -0,0 +1,93 @@
+import mock
+
+
+def test_available_networks(db_session):
+    from dallinger.experiment import Experiment
+    from dallinger.models import Node, Participant
+    from dallinger.networks import Empty
+
+    exp = Experiment(db_session)
+    joined, full, practice, available = [Empty() for _ in range(4)]
+    full.full = True
+    practice.role = 'practice'
+    participant = Participant(
+        worker_id='test', assignment_id='test', hit_id='test', mode='test')
+    db_session.add_all([joined, full, practice, available, participant])
+    db_session.add(Node(network=joined, participant=participant))
+    db_session.commit()
+
+    assert exp.available_networks(participant) == [
+        (practice.id, 'practice'), (available.id, 'default')]
+    # Practice networks are joined first
+    assert exp.get_network_for_participant(participant) == practice
+
+
+def test_random_network_is_chosen_by_id(db_session):
+    from dallinger.experiment import Experiment
+    from dallinger.models import Participant
+    from dallinger.networks import Empty
+
+    exp = Experiment(db_session)
+    net1, net2 = Empty(), Empty()
+    participant = Participant(
+        worker_id='test', assignment_id='test', hit_id='test', mode='test')
+    db_session.add_all([net1, net2, participant])
+    db_session.commit()
+
+    with mock.patch('dallinger.experiment.random.choice') as choice:
+        choice.side_effect = lambda rows: rows[-1]
+        assert exp.get_network_for_participant(participant) == net2
+    # The default choice only needs the ids of the networks
+    choice.assert_called_once_with([(net1.id, 'default'), (net2.id, 'default')])
+
+
+def test_network_filled_while_assigning_is_skipped(db_session):
+    from dallinger.experiment import Experiment
+    from dallinger.models import Participant
+    from dallinger.networks import Empty
+
+    exp = Experiment(db_session)
+    net1 = Empty()
+    net2 = Empty()
+    participant = Participant(
+        worker_id='test', assignment_id='test', hit_id='test', mode='test')
+    db_session.add_all([net1, net2, participant])
+    db_session.commit()
+
+    def choose_network(networks, participant):
+        assert all(isinstance(net, Empty) for net in networks)
+        # Another participant fills the first network meanwhile
+        db_session.execute('UPDATE network SET "full" = true WHERE id = :id',
+                           {'id': net1.id})
+        return networks[0]
+    exp.choose_network = choose_network
+
+    assert exp.get_network_for_participant(participant) == net2
+
+
+def test_network_counts_are_remembered_until_networks_change(db_session):
+    from dallinger.experiment import Experiment
+    from dallinger.networks import Empty
+
+    exp = Experiment(db_session)
+    net, other = Empty(), Empty()
+    db_session.add_all([net, other])
+    assert exp.count_networks() == 2
+    assert exp.count_networks(full=False) == 2
+    assert exp.network_ids() == sorted([net.id, other.id])
+
+    # Changes made behind the session's back go unnoticed...
+    db_session.execute('UPDATE network SET "full" = true WHERE id = :id',
+                       {'id': net.id})
+    assert exp.count_networks(full=False) == 2
+
+    # ...until the networks are flushed
+    net.max_size = 10
+    assert exp.count_networks(full=False) == 1
+    db_session.add(Empty())
+    assert exp.count_networks() == 3
+
+    # ...or the transaction ends
+    db_session.execute('UPDATE network SET "full" = false')
+    db_session.commit()
+    assert exp.count_networks(full=False) == 3
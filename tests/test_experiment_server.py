@@ -13,10 +13,13 @@ class TestExperimentServer(object):
 
     @pytest.fixture
     def app(self, db_session):
-        from dallinger.experiment_server import sockets
+        from dallinger.experiment_server import experiment_server, sockets
         config = get_config()
         if not config.ready:
             config.load()
+        # the database was reset, so the experiment must be set up again
+        experiment_server._experiment = None
+        experiment_server._summary = None
         app = sockets.app
         app.config['DEBUG'] = True
         app.config['TESTING'] = True
@@ -174,6 +177,167 @@ class TestExperimentServer(object):
         assert data.get('status') == 'success'
         assert data.get('infos') == []
 
+    def test_node_infos_paginated(self, db_session, app, node_id):
+        from dallinger import models
+        node = models.Node.query.get(node_id)
+        infos = [models.Info(origin=node, contents=str(i)) for i in range(3)]
+        db_session.add_all(infos)
+        db_session.commit()
+
+        resp = app.get('/node/{}/infos?limit=2'.format(node_id))
+        data = json.loads(resp.data)
+        assert data.get('status') == 'success'
+        assert [i['contents'] for i in data['infos']] == ['0', '1']
+
+        resp = app.get('/node/{}/infos?limit=2&after_id={}'.format(
+            node_id, data['infos'][-1]['id']))
+        data = json.loads(resp.data)
+        assert [i['contents'] for i in data['infos']] == ['2']
+
+    def test_node_infos_non_numeric_limit(self, app, node_id):
+        resp = app.get('/node/{}/infos?limit=lots'.format(node_id))
+        data = json.loads(resp.data)
+        assert data.get('status') == 'error'
+
+    def test_node_transmissions_negative_limit(self, app, node_id):
+        resp = app.get('/node/{}/transmissions?limit=-1'.format(node_id))
+        assert resp.status_code == 400
+        data = json.loads(resp.data)
+        assert data.get('status') == 'error'
+
+    def test_node_transmissions_since(self, db_session, app, node_id):
+        from dallinger import models
+        node_id_2 = self.node_id(app, self.participant_id(app))
+        node1 = models.Node.query.get(node_id)
+        node2 = models.Node.query.get(node_id_2)
+        node1.connect(whom=node2)
+        info1 = models.Info(origin=node1, contents="foo")
+        info2 = models.Info(origin=node1, contents="bar")
+        db_session.add_all([info1, info2])
+        first = node1.transmit(what=info1, to_whom=node2)[0]
+        second = node1.transmit(what=info2, to_whom=node2)[0]
+        db_session.commit()
+
+        resp = app.get('/node/{}/transmissions?since={}'.format(
+            node_id_2, first.id))
+        data = json.loads(resp.data)
+        assert data['status'] == 'success'
+        assert [t['info_id'] for t in data['transmissions']] == [info2.id]
+
+        resp = app.get('/node/{}/transmissions?since={}'.format(
+            node_id_2, first.creation_time.isoformat()))
+        data = json.loads(resp.data)
+        assert [t['info_id'] for t in data['transmissions']] == [info2.id]
+
+        node2.receive(what=second)
+        db_session.commit()
+        resp = app.get('/node/{}/received_infos'.format(node_id_2))
+        data = json.loads(resp.data)
+        assert data['status'] == 'success'
+        assert [i['id'] for i in data['infos']] == [info2.id]
+
+        # Nothing was received since the returned watermark
+        since = data['since']
+        resp = app.get('/node/{}/received_infos?since={}'.format(
+            node_id_2, since))
+        data = json.loads(resp.data)
+        assert data['status'] == 'success'
+        assert data['infos'] == []
+
+        # A transmission sent earlier but received later isn't skipped
+        node2.receive(what=first)
+        db_session.commit()
+        resp = app.get('/node/{}/received_infos?since={}'.format(
+            node_id_2, since))
+        data = json.loads(resp.data)
+        assert [i['id'] for i in data['infos']] == [info1.id]
+
+    def test_node_transmissions_since_invalid(self, app, node_id):
+        resp = app.get('/node/{}/transmissions?since=yesterday'.format(node_id))
+        data = json.loads(resp.data)
+        assert data['status'] == 'error'
+
+    def test_info_post_assigns_properties(self, app, node_id):
+        resp = app.post('/info/{}'.format(node_id), data={
+            'contents': 'foo',
+            'info_type': 'Gene',
+            'property1': 'bar',
+        })
+        data = json.loads(resp.data)
+        assert data['status'] == 'success'
+        assert data['info']['type'] == 'gene'
+        assert data['info']['contents'] == 'foo'
+        assert data['info']['property1'] == 'bar'
+
+    def test_info_post_missing_contents(self, app, node_id):
+        resp = app.post('/info/{}'.format(node_id))
+        data = json.loads(resp.data)
+        assert data['status'] == 'error'
+        assert 'contents not specified' in data['html']
+
+    def test_info_post_unknown_class(self, app, node_id):
+        resp = app.post('/info/{}'.format(node_id), data={
+            'contents': 'foo',
+            'info_type': 'Bogus',
+        })
+        data = json.loads(resp.data)
+        assert data['status'] == 'error'
+        assert 'unknown_class: Bogus for parameter info_type' in data['html']
+
+    def test_node_vectors_non_boolean_failed(self, app, node_id):
+        resp = app.get('/node/{}/vectors?failed=maybe'.format(node_id))
+        data = json.loads(resp.data)
+        assert data['status'] == 'error'
+        assert 'non-boolean failed: maybe' in data['html']
+
+    def _batch(self, app, operations):
+        resp = app.post('/batch', data=json.dumps(operations),
+                        content_type='application/json')
+        return json.loads(resp.data)
+
+    def test_batch(self, app, participant_id, node_id):
+        from dallinger import models
+        node_id_2 = self.node_id(app, self.participant_id(app))
+        models.Node.query.get(node_id).connect(
+            whom=models.Node.query.get(node_id_2))
+
+        data = self._batch(app, [
+            {'type': 'info', 'node_id': node_id, 'contents': 'foo',
+             'property1': 'bar'},
+            {'type': 'question', 'participant_id': participant_id,
+             'question': 'q', 'response': 'r', 'number': 1},
+            {'type': 'transmit', 'node_id': node_id, 'what': 'Info',
+             'to_whom': node_id_2},
+        ])
+
+        assert data['status'] == 'success'
+        info, question, transmit = data['results']
+        assert info['info']['contents'] == 'foo'
+        assert info['info']['property1'] == 'bar'
+        assert question['question']['response'] == 'r'
+        assert len(transmit['transmissions']) == 1
+        assert transmit['transmissions'][0]['info_id'] == info['info']['id']
+        assert models.Question.query.count() == 1
+
+    def test_batch_is_atomic(self, app, node_id):
+        from dallinger import models
+        data = self._batch(app, [
+            {'type': 'info', 'node_id': node_id, 'contents': 'foo'},
+            {'type': 'info', 'node_id': 999, 'contents': 'bar'},
+        ])
+
+        assert data['status'] == 'error'
+        assert 'operation 1 failed' in data['html']
+        assert models.Info.query.count() == 0
+
+    def test_batch_unknown_operation(self, app):
+        data = self._batch(app, [{'type': 'bogus'}])
+        assert data['status'] == 'error'
+
+    def test_batch_requires_list(self, app):
+        data = self._batch(app, {'type': 'info'})
+        assert data['status'] == 'error'
+
     def test_node_transmit_info_creates_transmission(self, db_session, app, node_id):
         from dallinger import models
         node_id_2 = self.node_id(app, self.participant_id(app))
@@ -293,6 +457,20 @@ class TestExperimentServer(object):
         assert worker_summary[0] == [u'approved', 1]
         assert worker_summary[1] == [u'submitted', 1]
 
+    def test_summary_is_reused_briefly(self, app):
+        from dallinger.experiment_server import experiment_server
+
+        first = json.loads(app.get('/summary').data)
+        self.node_id(app, self.participant_id(app))
+        assert json.loads(app.get('/summary').data) == first
+
+        later = experiment_server._summary[0] + experiment_server.SUMMARY_CACHE_SECONDS + 1
+        with mock.patch('dallinger.experiment_server.experiment_server.time.time',
+                        return_value=later):
+            data = json.loads(app.get('/summary').data)
+        assert data.get('nodes_remaining') == first['nodes_remaining'] - 1
+        assert data.get('summary') == [[u'working', 1]]
+
     def test_existing_experiment_property(self, app, participant_id):
         resp = app.get('/experiment/exists'.format(participant_id))
         data = json.loads(resp.data)
@@ -313,6 +491,19 @@ class TestExperimentServer(object):
         data = json.loads(resp.get_data())
         assert 'recruitment_url' in data
 
+    def test_experiment_is_created_once(self, app, participant_id):
+        from dallinger.experiment_server import experiment_server
+        exp = experiment_server.get_experiment()
+        class_to_patch = 'dallinger.experiment_server.experiment_server.Experiment'
+
+        with mock.patch(class_to_patch) as mock_class:
+            resp = app.post('/node/{}'.format(participant_id))
+            app.get('/experiment/exists')
+
+        assert json.loads(resp.data)['status'] == 'success'
+        assert not mock_class.called
+        assert experiment_server.get_experiment() is exp
+
     def test_launch_logging_fails(self, app):
         with mock.patch('dallinger.experiment_server.experiment_server.Experiment') as mock_class:
             bad_log = mock.Mock(side_effect=IOError)
@@ -267,6 +267,48 @@ class TestModels(object):
 
         raises(TypeError, node1.connect, whom=net)
 
+    def test_network_connect_many(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node1 = models.Node(network=net)
+        node2 = models.Node(network=net)
+        node3 = models.Node(network=net)
+        source = Source(network=net)
+        node1.connect(whom=node2)
+
+        vectors = net.connect_many([
+            (node1, node2), (node1, node3), (node2, node3), (node2, node3),
+            (source, node1)
+        ])
+
+        assert set((v.origin, v.destination) for v in vectors) == set([
+            (node1, node3), (node2, node3), (source, node1)
+        ])
+        assert set(node1.neighbors()) == set([node2, node3])
+        assert set(node3.neighbors(direction="from")) == set([node1, node2])
+        assert len(net.vectors()) == 4
+
+        raises(TypeError, net.connect_many, [(node1, source)])
+        raises(ValueError, net.connect_many, [(node1, node1)])
+
+        other = models.Network()
+        db_session.add(other)
+        stranger = models.Node(network=other)
+        raises(ValueError, net.connect_many, [(node1, stranger)])
+        raises(ValueError, net.connect_many, [(stranger, node1)])
+
+    def test_node_flatten_deep_list(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node = models.Node(network=net)
+
+        nested = []
+        for i in range(5000):
+            nested = [nested, i]
+
+        assert node.flatten([1, [2, [3, []], 4]]) == [1, 2, 3, 4]
+        assert node.flatten(nested) == list(range(5000))
+
     def test_node_outdegree(self, db_session):
         net = models.Network()
         self.add(db_session, net)
@@ -416,6 +458,97 @@ class TestModels(object):
         assert (repr(vector2).split("-") ==
                 ["Vector", str(node2.id), str(node1.id)])
 
+    def test_adjacency_index_tracks_new_vectors(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node1 = models.Node(network=net)
+        node2 = models.Node(network=net)
+        self.add(db_session, node1, node2)
+
+        assert node1.neighbors() == []
+        index = models.AdjacencyIndex.cached(net.id)
+        assert index is not None
+
+        vector = models.Vector(origin=node1, destination=node2)
+        assert index.successors(node1.id) == {node2.id}
+        assert node1.vectors(direction="outgoing") == [vector]
+        assert node2.is_connected(direction="from", whom=node1)
+
+    def test_adjacency_index_loads_only_the_nodes_asked_about(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node1 = models.Node(network=net)
+        node2 = models.Node(network=net)
+        node3 = models.Node(network=net)
+        self.add(db_session, node1, node2, node3)
+        node1.connect(whom=node2)
+        node2.connect(whom=node3)
+        db_session.commit()
+
+        assert node1.neighbors() == [node2]
+        index = models.AdjacencyIndex.cached(net.id)
+        assert index.loaded == {node1.id}
+        assert index.vectors(node3.id) == []
+
+        # The vector to node2 is loaded once, from either end
+        assert set(node2.neighbors(direction="either")) == {node1, node3}
+        assert len(index.vectors(node2.id)) == 2
+
+    def test_adjacency_index_tracks_failed_vectors(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node1 = models.Node(network=net)
+        node2 = models.Node(network=net)
+        vector = models.Vector(origin=node1, destination=node2)
+        self.add(db_session, node1, node2, vector)
+
+        assert node1.neighbors() == [node2]
+        vector.fail()
+        assert node1.neighbors() == []
+        assert node2.vectors() == []
+        assert node2.vectors(failed=True) == [vector]
+
+    def test_bulk_node_failure(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node1 = models.Node(network=net)
+        node2 = models.Node(network=net)
+        node3 = models.Node(network=net)
+        self.add(db_session, node1, node2, node3)
+
+        node1.connect(whom=node2)
+        node2.connect(whom=node3)
+        info = models.Info(origin=node1, contents="foo")
+        node1.transmit(what=info, to_whom=node2)
+        node2.receive()
+        copy = models.Info(origin=node2, contents="foo")
+        models.Transformation(info_in=info, info_out=copy)
+        db_session.commit()
+
+        node1.fail(bulk=True)
+
+        assert node1.failed is True
+        assert node1.vectors(failed=True)[0].failed is True
+        assert node2.neighbors(direction="from") == []
+        assert node2.neighbors(direction="to") == [node3]
+        assert info.failed is True
+        assert copy.failed is False
+        assert node1.transmissions(direction="all") == []
+        assert node2.transformations() == []
+        assert len(node2.transformations(failed=True)) == 1
+
+    def test_adjacency_index_discarded_on_commit(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node1 = models.Node(network=net)
+        node2 = models.Node(network=net)
+        self.add(db_session, node1, node2)
+
+        node1.neighbors()
+        assert models.AdjacencyIndex.cached(net.id) is not None
+        db_session.commit()
+        assert models.AdjacencyIndex.cached(net.id) is None
+
     ##################################################################
     # Info
     ##################################################################
@@ -539,6 +672,134 @@ class TestModels(object):
         assert transmissions[0].origin is agent1
         assert transmissions[0].destination is agent2
 
+    def test_transmit_many_infos_to_many_nodes(self, db_session):
+        net = models.Network()
+        agent1 = nodes.ReplicatorAgent(network=net)
+        agent2 = nodes.ReplicatorAgent(network=net)
+        agent3 = nodes.ReplicatorAgent(network=net)
+        agent1.connect(whom=[agent2, agent3])
+
+        info1 = models.Info(origin=agent1, contents="foo")
+        info2 = models.Info(origin=agent1, contents="bar")
+        self.add(db_session, info1, info2)
+        transmissions = agent1.transmit(
+            what=[info1, info2], to_whom=nodes.ReplicatorAgent)
+
+        assert len(transmissions) == 4
+        assert set((t.info, t.destination) for t in transmissions) == set([
+            (info1, agent2), (info1, agent3), (info2, agent2), (info2, agent3)
+        ])
+        for t in transmissions:
+            assert t.status == "pending"
+            assert t.vector.destination is t.destination
+        assert len(agent2.transmissions(direction="incoming")) == 2
+
+    def test_transmit_raises_if_info_failed(self, db_session):
+        net = models.Network()
+        agent1 = nodes.ReplicatorAgent(network=net)
+        agent2 = nodes.ReplicatorAgent(network=net)
+        agent1.connect(whom=agent2)
+
+        info1 = models.Info(origin=agent1, contents="foo")
+        self.add(db_session, info1)
+        info1.fail()
+
+        with raises(ValueError):
+            agent1.transmit(what=info1, to_whom=agent2)
+        assert agent1.transmissions() == []
+
+    def test_receive_marks_pending_transmissions_received(self, db_session):
+        net = models.Network()
+        agent1 = nodes.ReplicatorAgent(network=net)
+        agent2 = nodes.ReplicatorAgent(network=net)
+        agent1.connect(whom=agent2)
+
+        info1 = models.Info(origin=agent1, contents="foo")
+        info2 = models.Info(origin=agent1, contents="bar")
+        self.add(db_session, info1, info2)
+        transmissions = agent1.transmit(what=[info1, info2], to_whom=agent2)
+        assert [t.status for t in transmissions] == ["pending", "pending"]
+
+        agent2.receive()
+
+        for t in transmissions:
+            assert t.status == "received"
+            assert t.receive_time is not None
+        assert agent2.transmissions(direction="incoming",
+                                    status="pending") == []
+        assert sorted(i.contents for i in agent2.infos()) == ["bar", "foo"]
+
+    def test_receive_specific_transmission(self, db_session):
+        net = models.Network()
+        agent1 = nodes.ReplicatorAgent(network=net)
+        agent2 = nodes.ReplicatorAgent(network=net)
+        agent1.connect(whom=agent2)
+
+        info1 = models.Info(origin=agent1, contents="foo")
+        info2 = models.Info(origin=agent1, contents="bar")
+        self.add(db_session, info1, info2)
+        transmission = agent1.transmit(what=info1, to_whom=agent2)[0]
+        agent1.transmit(what=info2, to_whom=agent2)
+
+        agent2.receive(what=transmission)
+
+        assert transmission.status == "received"
+        assert len(agent2.transmissions(direction="incoming",
+                                        status="pending")) == 1
+        assert [i.contents for i in agent2.infos()] == ["foo"]
+
+        with raises(ValueError):
+            agent2.receive(what=transmission)
+
+    def test_transmissions_since(self, db_session):
+        net = models.Network()
+        agent1 = nodes.ReplicatorAgent(network=net)
+        agent2 = nodes.ReplicatorAgent(network=net)
+        agent1.connect(whom=agent2)
+
+        info1 = models.Info(origin=agent1, contents="foo")
+        info2 = models.Info(origin=agent1, contents="bar")
+        self.add(db_session, info1, info2)
+        first = agent1.transmit(what=info1, to_whom=agent2)[0]
+        second = agent1.transmit(what=info2, to_whom=agent2)[0]
+
+        assert agent2.transmissions(direction="incoming",
+                                    since=first.id) == [second]
+        assert agent2.transmissions(direction="incoming",
+                                    since=first.creation_time) == [second]
+
+        # The transmission sent last is received first
+        agent2.receive(what=second)
+        agent2.receive(what=first)
+        assert first.receive_order > second.receive_order
+        assert agent2.received_infos(since=second.receive_order) == [info1]
+        assert agent2.received_infos(since=first.receive_order) == []
+
+        # An older info received later is after the watermark
+        third = agent1.transmit(what=info2, to_whom=agent2)[0]
+        agent2.receive()
+        assert agent2.received_infos(since=first.receive_order) == [info2]
+        assert agent2.received_infos(since=first.receive_time) == [info2]
+        assert third.receive_time > first.receive_time
+
+    def test_update_receive_order(self, db_session):
+        net = models.Network()
+        agent1 = nodes.ReplicatorAgent(network=net)
+        agent2 = nodes.ReplicatorAgent(network=net)
+        agent1.connect(whom=agent2)
+        info = models.Info(origin=agent1, contents="foo")
+        self.add(db_session, info)
+        received = agent1.transmit(what=info, to_whom=agent2)[0]
+        pending = agent1.transmit(what=info, to_whom=agent2)[0]
+        agent2.receive(what=received)
+        db_session.execute('UPDATE transmission SET receive_order = NULL')
+
+        models.update_receive_order()
+        db_session.refresh(received)
+        db_session.refresh(pending)
+        assert received.receive_order is not None
+        assert pending.receive_order is None
+
     def test_transmit_raises_if_no_connection_to_destination(self, db_session):
         net1 = models.Network()
         net2 = models.Network()
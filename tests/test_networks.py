@@ -29,6 +29,79 @@ class TestNetworks(object):
         assert len(net.nodes(failed="all")) == 6
         assert len(net.nodes(failed=True)) == 1
 
+    def test_bulk_network_failure(self, db_session):
+        net = networks.Network()
+        db_session.add(net)
+        db_session.commit()
+
+        agents = [nodes.Agent(network=net) for _ in range(3)]
+        agents[0].connect(whom=agents[1:])
+        info = models.Info(origin=agents[0], contents="foo")
+        agents[0].transmit(what=info, to_whom=agents[1])
+        db_session.commit()
+
+        net.fail(bulk=True)
+
+        assert net.failed is True
+        assert net.nodes() == []
+        assert len(net.nodes(failed=True)) == 3
+        assert all(a.failed for a in agents)
+        assert net.vectors() == []
+        assert len(net.vectors(failed=True)) == 2
+        assert net.infos() == []
+        assert info.failed is True
+        assert info.time_of_death == net.time_of_death
+        assert net.transmissions() == []
+        assert len(net.transmissions(failed=True)) == 1
+
+    def test_node_count(self, db_session):
+        net = networks.Network(max_size=3)
+        db_session.add(net)
+        db_session.commit()
+
+        agents = [nodes.Agent(network=net) for _ in range(2)]
+        assert net.node_count == 2
+        assert net.full is False
+
+        nodes.Source(network=net)
+        assert net.node_count == 3
+        assert net.full is True
+
+        agents[0].fail()
+        assert net.node_count == 2
+        assert net.full is False
+        assert net.node_count == net.size()
+
+    def test_node_count_keeps_concurrent_changes(self, db_session):
+        net = networks.Network(max_size=10)
+        db_session.add(net)
+        db_session.commit()
+        nodes.Agent(network=net)
+        db_session.commit()
+
+        # Another transaction adds a node to the same network meanwhile
+        session2 = db_session.session_factory()
+        session2.execute(
+            'UPDATE network SET node_count = node_count + 1 WHERE id = :id',
+            {'id': net.id})
+        session2.commit()
+        session2.close()
+
+        nodes.Agent(network=net)
+        assert net.node_count == 3
+
+    def test_update_node_counts(self, db_session):
+        net = networks.Network()
+        db_session.add(net)
+        db_session.commit()
+        agents = [nodes.Agent(network=net) for _ in range(3)]
+        agents[0].fail()
+        db_session.execute('UPDATE network SET node_count = 0')
+
+        models.update_node_counts()
+        db_session.refresh(net)
+        assert net.node_count == 2
+
     def test_network_agents(self, db_session):
         net = networks.Network()
         db_session.add(net)
@@ -84,6 +157,32 @@ class TestNetworks(object):
         assert set(net.nodes(failed=True)) == set([node1, agent1])
         assert set(net.nodes(type=nodes.Agent, failed="all")) == set([agent1, agent2, agent3])
 
+    def test_network_nodes_paginated(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node1 = models.Node(network=net)
+        node2 = models.Node(network=net)
+        agent = nodes.Agent(network=net)
+        db_session.commit()
+
+        assert net.nodes(limit=2) == [node1, node2]
+        assert net.nodes(after_id=node2.id) == [agent]
+        assert net.nodes(after_id=node1.id, limit=1) == [node2]
+        assert net.nodes(type=nodes.Agent, after_id=node1.id) == [agent]
+        with pytest.raises(ValueError):
+            net.nodes(limit=-1)
+
+    def test_network_nodes_stream(self, db_session):
+        net = models.Network()
+        db_session.add(net)
+        node1 = models.Node(network=net)
+        node2 = models.Node(network=net)
+        db_session.commit()
+
+        stream = net.nodes(stream=True)
+        assert not isinstance(stream, list)
+        assert set(stream) == set([node1, node2])
+
     def test_network_vectors(self, db_session):
         net = networks.Network()
         db_session.add(net)
@@ -335,6 +434,26 @@ class TestNetworks(object):
         assert len(net.nodes(type=nodes.Agent)) == m0 + 2
         assert len(net.vectors()) == m0 * (m0 - 1) + 2 * 2 * m
 
+    def test_scale_free_attaches_to_connected_members(self, db_session):
+        net = networks.ScaleFree(m0=2, m=1)
+        db_session.add(net)
+        for i in range(2):
+            net.add_node(nodes.Agent(network=net))
+        # A member that was never attached to the network has no vectors
+        loner = nodes.Agent(network=net)
+        db_session.commit()
+
+        for i in range(10):
+            agent = nodes.Agent(network=net)
+            net.add_node(agent)
+            # Only the chosen member is loaded, not the whole network
+            assert models.AdjacencyIndex.cached(net.id) is None
+            assert len(agent.neighbors()) == 1
+            assert loner not in agent.neighbors()
+            db_session.commit()
+
+        assert loner.vectors() == []
+
     def test_scale_free_repr(self, db_session):
         net = networks.ScaleFree(m0=4, m=4)
         db_session.add(net)
@@ -412,6 +531,10 @@ class GenerationalAgent(nodes.Agent):
         return cast(self.property2, Integer)
 
 
+generation_index = models.hybrid_property_index(
+    GenerationalAgent, "network_id", "generation")
+
+
 class TestDiscreteGenerational(TestNetworks):
 
     n_gens = 4
@@ -443,6 +566,20 @@ class TestDiscreteGenerational(TestNetworks):
 
         return by_gen
 
+    def test_generation_index(self, db_session):
+        from sqlalchemy.dialects import postgresql
+        from sqlalchemy.schema import CreateIndex
+        ddl = str(CreateIndex(generation_index).compile(
+            dialect=postgresql.dialect()))
+
+        assert generation_index.name == "ix_node_test_agent_network_id_generation"
+        assert "network_id, CAST(property2 AS INTEGER)" in ddl
+        assert "failed = false" in ddl
+        assert "type IN ('test_agent')" in ddl
+        assert db_session.execute(
+            "SELECT count(*) FROM pg_indexes WHERE indexname = :name",
+            {"name": generation_index.name}).scalar() == 1
+
     def test_initial_source_attr_true(self, net):
         assert net.initial_source
 
@@ -0,0 +1,60 @@
+from collections import Counter
+import mock
+import pytest
+
+from dallinger.sampling import _sample_indices
+from dallinger.sampling import _sample_indices_numpy
+from dallinger.sampling import weighted_sample
+
+
+@pytest.fixture(params=["numpy", "bisect"])
+def implementation(request):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        yield
+    else:
+        with mock.patch("dallinger.sampling.numpy", None):
+            yield
+
+
+@pytest.mark.usefixtures("implementation")
+class TestWeightedSample(object):
+
+    def test_single_draw(self):
+        assert weighted_sample(["a", "b", "c"], [0, 1, 0]) == "b"
+
+    def test_k_draws_are_proportional_to_weights(self):
+        draws = weighted_sample(["a", "b", "c"], [1, 0, 3.0], k=4000)
+        counts = Counter(draws)
+        assert len(draws) == 4000
+        assert counts["b"] == 0
+        assert 2500 < counts["c"] < 3500
+
+    def test_zero_weights_raise(self):
+        with pytest.raises(ValueError):
+            weighted_sample(["a", "b"], [0, 0])
+
+    def test_negative_weights_raise(self):
+        with pytest.raises(ValueError):
+            weighted_sample(["a", "b"], [2, -1])
+
+    def test_mismatched_lengths_raise(self):
+        with pytest.raises(ValueError):
+            weighted_sample(["a", "b"], [1])
+
+    def test_none_weights_raise(self):
+        with pytest.raises(ValueError):
+            weighted_sample(["a", "b"], [1, None])
+
+
+class TestRoundOff(object):
+    """random() is below 1, but multiplying by the total can round up."""
+
+    def test_draw_at_the_total_picks_last_positive_weight(self):
+        with mock.patch("dallinger.sampling.random.random", return_value=1.0):
+            assert _sample_indices([1, 2, 0], 3) == [1, 1, 1]
+
+    def test_numpy_draw_at_the_total_picks_last_positive_weight(self):
+        numpy = pytest.importorskip("numpy")
+        with mock.patch.object(numpy.random, "random", side_effect=numpy.ones):
+            assert _sample_indices_numpy([1, 2, 0], 3) == [1, 1, 1]
@@ -1,4 +1,5 @@
 from mock import Mock
+from mock import patch
 import gevent
 import pytest
 import socket
@@ -7,7 +8,9 @@ import socket
 @pytest.fixture
 def sockets():
     from dallinger.experiment_server import sockets
-    return sockets
+    yield sockets
+
+    sockets.chat_backend.stop()
 
 
 @pytest.fixture
@@ -25,6 +28,7 @@ def chat(sockets, pubsub):
 
     yield chat
 
+    chat.stop()
     gevent.wait()
 
 
@@ -52,7 +56,7 @@ class TestChatBackend:
     def test_subscribe_to_new_channel_registers_client_for_channel(self, chat):
         client = Mock()
         chat.subscribe(client, 'custom')
-        assert chat.clients == {'custom': [client]}
+        assert chat.clients == {'custom': {client}}
 
     def test_subscribe_to_new_channel_subscribes_on_redis(self, chat):
         client = Mock()
@@ -72,7 +76,7 @@ class TestChatBackend:
         client = Mock()
         chat.subscribe(client, 'quorum')
         chat.unsubscribe(client, 'quorum')
-        assert chat.clients == {'quorum': []}
+        assert chat.clients == {'quorum': set()}
 
     def test_send(self, chat):
         client = Mock()
@@ -84,7 +88,37 @@ class TestChatBackend:
         client.send.side_effect = socket.error()
         chat.subscribe(client, 'quorum')
         chat.send(client, 'message')
-        assert chat.clients == {'quorum': []}
+        assert chat.clients == {'quorum': set()}
+
+    def test_send_exception_unsubscribes_from_all_channels(self, chat):
+        client = Mock()
+        client.send.side_effect = socket.error()
+        chat.subscribe(client, 'quorum')
+        chat.subscribe(client, 'custom')
+        chat.send(client, 'message')
+        assert chat.clients == {'quorum': set(), 'custom': set()}
+        assert client not in chat.channels
+
+    def test_enqueue_drops_oldest_messages_of_slow_client(self, chat, sockets):
+        client = Mock()
+        for i in range(sockets.CLIENT_QUEUE_SIZE + 5):
+            chat.enqueue(client, str(i))
+
+        gevent.wait()  # let the sender drain the queue
+        sent = [call[0][0] for call in client.send.call_args_list]
+        assert sent == [str(i + 5) for i in range(sockets.CLIENT_QUEUE_SIZE)]
+        assert chat.pending == {}
+        assert chat.senders == 0
+
+    def test_enqueue_limits_sender_greenlets(self, chat, sockets):
+        clients = [Mock() for _ in range(sockets.SENDERS * 2)]
+        for client in clients:
+            chat.enqueue(client, 'message')
+        assert chat.senders == sockets.SENDERS
+
+        gevent.wait()
+        for client in clients:
+            client.send.assert_called_once_with('message')
 
     def test_run(self, chat):
         client = Mock()
@@ -111,40 +145,86 @@ class TestChatBackend:
     def test_heartbeat(self, chat, sockets):
         client = Mock()
         client.closed = False
-        chat.send = Mock()
+        chat.greenlet = Mock()
+        chat.connect(client, 'quorum')
         sockets.HEARTBEAT_DELAY = 1
 
-        gevent.spawn(chat.heartbeat, client)
+        heartbeat = gevent.spawn(chat.heartbeat)
         gevent.sleep(2)
-        client.closed = True
+        heartbeat.kill()
+
+        client.send.assert_called_with('ping')
+
+    def test_sweep_pings_live_clients_and_removes_closed_ones(self, chat):
+        live = Mock()
+        live.closed = False
+        closed = Mock()
+        closed.closed = True
+        chat.greenlet = Mock()
+        chat.connect(live, 'quorum')
+        chat.connect(closed, 'quorum')
+
+        chat.sweep()
+        gevent.wait()
+
+        live.send.assert_called_once_with('ping')
+        closed.send.assert_not_called()
+        assert chat.clients == {'quorum': {live}}
+        assert chat.sockets == {live}
+
+    def test_sweep_skips_clients_that_are_not_websockets(self, chat):
+        experiment = Mock()
+        experiment.closed = True
+        chat.greenlet = Mock()
+        chat.subscribe(experiment, 'quorum')
+
+        chat.sweep()
         gevent.wait()
 
-        chat.send.assert_called_with(client, 'ping')
+        experiment.send.assert_not_called()
+        assert chat.clients == {'quorum': {experiment}}
 
     def test_chat_subscribes_to_requested_channel(self, sockets):
         ws = Mock()
+        ws.closed = False
+        subscribed = []
+
+        def receive():
+            subscribed.append(ws in sockets.chat_backend.clients['special'])
+            return None
+        ws.receive.side_effect = receive
         sockets.request = Mock()
         sockets.request.args = {'channel': 'special'}
         sockets.chat(ws)
-        assert ws in sockets.chat_backend.clients['special']
+        assert subscribed == [True]
+
+        # The client is forgotten once its socket closes
+        assert ws not in sockets.chat_backend.clients['special']
+        assert ws not in sockets.chat_backend.channels
 
     def test_chat_publishes_message_to_requested_channel(self, sockets, pubsub, mocksocket):
         ws = mocksocket
         ws.receive.return_value = 'special:incoming message!'
         sockets.request = Mock()
-        sockets.request.args = {'tolerance': '.5'}
-        sockets.conn = Mock()
+        sockets.request.args = {}
         sockets.chat_backend.pubsub = pubsub
-        sockets.chat(ws)
-        sockets.conn.publish.assert_called_once_with(
-            'special', 'incoming message!'
-        )
+        with patch('dallinger.db.publish_in_background') as publish:
+            sockets.chat(ws)
+        # Even with publish_in_background off, as chat always runs in gevent
+        publish.assert_called_once_with([('special', 'incoming message!')])
 
-    def test_sleeps_for_requested_time(self, sockets, mocksocket):
-        ws = mocksocket
-        ws.receive.return_value = 'somechannel:incoming message!'
+    def test_chat_stops_when_socket_closes(self, sockets, pubsub):
+        ws = Mock()
+        ws.closed = False
+
+        def receive():
+            ws.closed = True
+            return None
+        ws.receive.side_effect = receive
         sockets.request = Mock()
-        sockets.request.args.get.return_value = '.5'
-        sockets.gevent = Mock()
-        sockets.chat(ws)
-        sockets.gevent.sleep.assert_called_once_with(0.5)
+        sockets.request.args = {}
+        sockets.chat_backend.pubsub = pubsub
+        with patch('dallinger.db.publish_in_background') as publish:
+            sockets.chat(ws)
+        ws.receive.assert_called_once_with()
+        publish.assert_not_called()